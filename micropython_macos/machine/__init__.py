@@ -138,14 +138,21 @@ class SPI:
     LSB = const(1)
 
     def __init__(self, id, *args, **kwargs):
-        self.init(*args)
+        self._id = id
+        # Buffers passed to write(), recorded for inspection by tests
+        self.writes = []
+        self.init(*args, **kwargs)
 
     def init(self, baudrate=1000000,  polarity=0, phase=0, bits=8,
              firstbit=MSB, sck=None, mosi=None, miso=None, pins=None):
-        raise NotImplementedError
+        self._baudrate = baudrate
+        self._polarity = polarity
+        self._phase = phase
+        self._bits = bits
+        self._firstbit = firstbit
 
     def deinit(self):
-        raise NotImplementedError
+        pass
 
     def read(self, nbytes, write=0x00):
         raise NotImplementedError
@@ -154,7 +161,7 @@ class SPI:
         raise NotImplementedError
 
     def write(self, buf):
-        raise NotImplementedError
+        self.writes.append(bytes(buf))
 
     def write_readinto(self, write_buf, read_buf):
         raise NotImplementedError
@@ -17,6 +17,13 @@ NET_SCAN_HIDDEN_IDX = const(5)
 CAPTIVE_STARBUCKS_URL_PREFIX = b'http://sbux-portal.appspot.com/splash'
 CAPTIVE_STARBUCKS_SUBMIT_URL = 'http://sbux-portal.appspot.com/submit'
 
+CAPTIVE_CHECK_HOST = 'clients3.google.com'
+
+# Seconds to wait for a captive portal check to connect or read, and for the
+# whole check
+CAPTIVE_CHECK_TIMEOUT = 5
+CAPTIVE_CHECK_TOTAL_TIMEOUT = 10
+
 
 class WirelessNetworkConnectError(Exception):
     pass
@@ -46,6 +53,8 @@ def connect_to_ssid(ssid, password='', wlan=None):
         wlan = network.WLAN(network.STA_IF)
         wlan.active(True)
 
+    # Addresses cached on a previous network may not be valid on this one
+    urequests_ext.flush_dns_cache()
     wlan.connect(ssid, password)
     while 1:
         status = wlan.status()
@@ -126,7 +135,9 @@ class CaptivePortalError(Exception):
 # https://stackoverflow.com/a/14030276
 def is_captive():
     try:
-        r = urequests_ext.get('http://clients3.google.com/generate_204')
+        r = urequests_ext.get('http://%s/generate_204' % CAPTIVE_CHECK_HOST,
+                              timeout=CAPTIVE_CHECK_TIMEOUT,
+                              total_timeout=CAPTIVE_CHECK_TOTAL_TIMEOUT)
     except OSError as err:
         return (True, err)
     r.close()
@@ -165,12 +176,18 @@ def get_past_captive_portal(ssid, ip_addr, mac_addr):
             'Not connected to the Internet and redirect is to an '
             'unsupported redirect URL: %s' % redirect_url)
 
+    # Captive portals can answer DNS lookups with their own address until
+    # they're passed, so don't keep the probe host's answer after a captive
+    # result
+    urequests_ext.flush_dns_cache(CAPTIVE_CHECK_HOST)
+
     # Getting access to the Internet may take a few seconds after
     # submitting the form on the captive portal.
     start = utime.ticks_ms()
     while is_captive()[0]:
         if utime.ticks_diff(utime.ticks_ms(), start) > 10000:
             raise CaptivePortalError('Could not get past captive portal')
+        urequests_ext.flush_dns_cache(CAPTIVE_CHECK_HOST)
         utime.sleep_ms(1000)
 
 
@@ -1,9 +1,13 @@
 from shift_register.shift_register import ShiftRegisterSIPO
 from shift_register.shift_register_output_pins import ShiftRegisterOutputPins
 from shift_register.shift_register_as_gpio import ShiftRegisterSIPO_as_GPIO
+from shift_register.shift_register_pwm import ShiftRegisterPWM
+from shift_register.shift_register_animation import ShiftRegisterAnimation
 
 __all__ = [
     'ShiftRegisterSIPO',
     'ShiftRegisterOutputPins',
     'ShiftRegisterSIPO_as_GPIO',
+    'ShiftRegisterPWM',
+    'ShiftRegisterAnimation',
 ]
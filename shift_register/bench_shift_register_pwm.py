@@ -0,0 +1,49 @@
+"""Measures the refresh rate of ShiftRegisterPWM for different chain
+lengths. Run on the target board:
+
+    micropython bench_shift_register_pwm.py
+"""
+import utime
+from shift_register import ShiftRegisterSIPO
+from shift_register_pwm import ShiftRegisterPWM
+
+DATA_PIN_ID = 13
+CLOCK_PIN_ID = 14
+LATCH_PIN_ID = 15
+
+BITS = 4
+CYCLES = 20
+
+
+def bench(num_chips):
+    sr = ShiftRegisterSIPO(data_pin_id=DATA_PIN_ID,
+                           clock_pin_id=CLOCK_PIN_ID,
+                           latch_pin_id=LATCH_PIN_ID,
+                           num_chips=num_chips)
+    pwm = ShiftRegisterPWM(sr, bits=BITS)
+    pwm.duty_all([i % (pwm.max_duty + 1) for i in range(len(sr))])
+
+    ticks = CYCLES * pwm.max_duty
+    start = utime.ticks_us()
+    for _ in range(ticks):
+        pwm.tick()
+    elapsed_us = utime.ticks_diff(utime.ticks_us(), start)
+
+    # Only BITS ticks per cycle shift out, the rest are skipped. The timer
+    # period has to be at least as long as a tick that shifts out.
+    tick_us = elapsed_us // ticks
+    shift_us = elapsed_us // (CYCLES * BITS)
+    print('{:3d} chips: {:6d} us/shift, {:6d} us/tick avg, '
+          'max {:6.1f} Hz refresh'.format(
+              num_chips, shift_us, tick_us,
+              1000000 / (shift_us * pwm.max_duty)))
+
+
+def main():
+    print('ShiftRegisterPWM bits={}'.format(BITS))
+    for num_chips in (1, 2, 4, 8, 16):
+        bench(num_chips)
+
+
+if __name__ == '__main__':
+    main()
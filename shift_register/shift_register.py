@@ -2,6 +2,38 @@ from machine import Pin
 from micropython import const
 
 
+_reversed_bits = None
+
+
+def _reversed_bits_table():
+    """Returns a 256-byte table mapping each byte to its bits reversed"""
+    global _reversed_bits
+    if _reversed_bits is None:
+        table = bytearray(256)
+        for i in range(256):
+            r = 0
+            for b in range(8):
+                r = (r << 1) | ((i >> b) & 1)
+            table[i] = r
+        _reversed_bits = bytes(table)
+    return _reversed_bits
+
+
+_byte_bits = None
+
+
+def _byte_bits_table():
+    """Returns a 2048-byte table with the bits of each byte, MSB first. The
+    bits of byte b are at [b * 8:b * 8 + 8]."""
+    global _byte_bits
+    if _byte_bits is None:
+        table = bytearray(256 * 8)
+        for i in range(256 * 8):
+            table[i] = ((i >> 3) >> (7 - (i & 7))) & 1
+        _byte_bits = bytes(table)
+    return _byte_bits
+
+
 class ShiftRegisterSIPO:
     """Shift Register class for serial-in, parallel-out shift registers
     (e.g. SN74HC595)
@@ -12,18 +44,71 @@ class ShiftRegisterSIPO:
     MSB_FIRST = const(0)
     LSB_FIRST = const(1)
 
-    # TODO: Support other lengths
+    # Number of outputs per chip
     SHIFT_REGISTER_LENGTH = const(8)
 
     def __init__(self, data_pin_id, clock_pin_id, latch_pin_id,
-                 initial_pin_values=0x00, bit_order=MSB_FIRST):
-        if bit_order != ShiftRegisterSIPO.MSB_FIRST:
-            raise NotImplementedError('Only supports bit_order=MSB_FIRST')
-        self._data_pin = Pin(data_pin_id, Pin.OUT, value=0)
-        self._clock_pin = Pin(clock_pin_id, Pin.OUT, value=0)
+                 initial_pin_values=0x00, bit_order=MSB_FIRST, num_chips=1,
+                 spi=None):
+        """num_chips is the number of daisy-chained shift registers. The whole
+        chain is treated as one shift register with num_chips * 8 outputs and
+        is latched once per shift_out. With MSB_FIRST, outputs 0-7 are on the
+        chip wired to the data pin, 8-15 on the next chip in the chain, and
+        so on. LSB_FIRST reverses the whole chain, the outputs of each chip
+        as well as the order of the chips: outputs 0-7 are on the last chip
+        in the chain and the highest outputs on the chip wired to the data
+        pin.
+
+        If spi (a machine.SPI object) is given, the data is sent with
+        spi.write and data_pin_id and clock_pin_id are ignored (they can be
+        None). The SPI object should be configured with firstbit=SPI.MSB,
+        for bit_order=LSB_FIRST the bits are reversed before sending.
+        """
+        if bit_order not in (ShiftRegisterSIPO.MSB_FIRST,
+                             ShiftRegisterSIPO.LSB_FIRST):
+            raise ValueError('Unknown bit_order: %s' % bit_order)
+        if num_chips < 1:
+            raise ValueError('num_chips must be >= 1')
+        self._length = num_chips * ShiftRegisterSIPO.SHIFT_REGISTER_LENGTH
+        self._bit_order = bit_order
+        if bit_order == ShiftRegisterSIPO.LSB_FIRST:
+            self._reversed_bits = _reversed_bits_table()
+        else:
+            self._reversed_bits = None
+        # Output data in the order it's shifted out, one byte per chip
+        self._buf = bytearray(num_chips)
+        self._spi = spi
+        if spi is not None:
+            self._shift = self._shift_spi
+        else:
+            self._data_pin = Pin(data_pin_id, Pin.OUT, value=0)
+            self._clock_pin = Pin(clock_pin_id, Pin.OUT, value=0)
+            # Bound methods are allocated when they're created, so create
+            # them once for _shift_bits()
+            self._data_value = self._data_pin.value
+            self._clock_on = self._clock_pin.on
+            self._clock_off = self._clock_pin.off
+            self._byte_bits = _byte_bits_table()
+            self._shift = self._shift_bits
         self._latch_pin = Pin(latch_pin_id, Pin.OUT, value=0)
+        self._hold_count = 0
+        # One byte memoryviews of self._buf used by shift_out_async()
+        self._async_chunks = None
+        # Pin values last shifted out and latched
+        self._latched_values = None
+        # Number of calls to shift_out that shifted out or were skipped
+        # because the pin values were unchanged
+        self.shifts_executed = 0
+        self.shifts_skipped = 0
         self.shift_out(initial_pin_values)
 
+    @classmethod
+    def from_spi(cls, spi, latch_pin_id, **kwargs):
+        """Create a shift register that is written to using hardware SPI.
+        Connect the data pin to the SPI MOSI pin and the clock pin to the SPI
+        SCK pin."""
+        return cls(None, None, latch_pin_id, spi=spi, **kwargs)
+
     def __getitem__(self, key):
         return (self._pin_values >> key) & 1
 
@@ -38,17 +123,188 @@ class ShiftRegisterSIPO:
         return self._pin_values
 
     def __str__(self):
-        return '0b{:08b}'.format(self._pin_values)
+        return ('0b{:0%db}' % self._length).format(self._pin_values)
 
     def __len__(self):
-        return ShiftRegisterSIPO.SHIFT_REGISTER_LENGTH
+        return self._length
+
+    def __enter__(self):
+        self.hold()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.commit()
+
+    def batch(self):
+        """Returns a context manager that defers shifting out until the end
+        of the with block, e.g.
+
+            with sr.batch():
+                for i in range(len(sr)):
+                    sr[i] = i % 2
+        """
+        return self
+
+    def hold(self):
+        """Stop shifting out changes until commit() is called. Pin values
+        are still updated. Calls to hold() and commit() can be nested."""
+        self._hold_count += 1
+
+    def commit(self):
+        """Ends a hold(). Shifts out the pin values once if they were changed
+        while held."""
+        if self._hold_count > 0:
+            self._hold_count -= 1
+        if not self._hold_count:
+            self.shift_out(self._pin_values)
+
+    def refresh(self):
+        """Shifts out the pin values even if they are unchanged."""
+        self._latched_values = None
+        self.shift_out(self._pin_values)
 
     def shift_out(self, data):
+        """Shifts out and latches data. Does nothing if data is the same as
+        the pin values last latched."""
         self._pin_values = data
-        for i in range(ShiftRegisterSIPO.SHIFT_REGISTER_LENGTH - 1, -1, -1):
-            self._data_pin.value(self[i])
-            self._clock_pin.on()
-            self._clock_pin.off()
+        if self._hold_count:
+            return
+        if data == self._latched_values:
+            self.shifts_skipped += 1
+            return
+        self._pack(data)
+        self._shift(self._buf)
 
         self._latch_pin.on()
         self._latch_pin.off()
+        self._latched_values = data
+        self.shifts_executed += 1
+
+    async def shift_out_async(self, data):
+        """Like shift_out() but yields to the uasyncio event loop after each
+        chip is shifted out, so long chains don't block other tasks.
+
+        The shift register is held while this runs, so changes made by other
+        tasks (sr[i] = v, shift_out() etc.) are shifted out once it's done.
+        """
+        self._pin_values = data
+        if self._hold_count:
+            return
+        if data == self._latched_values:
+            self.shifts_skipped += 1
+            return
+        await self._shift_out_async(data)
+
+    async def run_refresh(self, interval_ms=20):
+        """Shifts out the latest pin values every interval_ms. Run as a
+        uasyncio task.
+
+        The shift register is held while this runs, so any number of
+        changes between refreshes (sr[i] = v, shift_out() etc.) are coalesced
+        into one shift_out_async().
+        """
+        import uasyncio
+        self.hold()
+        try:
+            while True:
+                if self._pin_values != self._latched_values:
+                    await self._shift_out_async(self._pin_values)
+                await uasyncio.sleep_ms(interval_ms)
+        finally:
+            # Cancelled, possibly part way through shifting out
+            self._latched_values = None
+            self.commit()
+
+    async def _shift_out_async(self, data):
+        import uasyncio
+        chunks = self._async_chunks
+        if chunks is None:
+            buf = memoryview(self._buf)
+            chunks = self._async_chunks = [buf[i:i + 1]
+                                           for i in range(len(buf))]
+        # Keep other shift_out() calls from packing and shifting in between
+        # the chips. The chain holds neither data nor the old values until
+        # latched.
+        self.hold()
+        self._latched_values = None
+        try:
+            self._pack(data)
+            for chunk in chunks:
+                self._shift(chunk)
+                await uasyncio.sleep_ms(0)
+
+            self._latch_pin.on()
+            self._latch_pin.off()
+            self._latched_values = data
+            self.shifts_executed += 1
+        finally:
+            # Shifts out pin values changed while shifting, or all of them
+            # if cancelled part way
+            self.commit()
+
+    @property
+    def frame_size(self):
+        """Number of bytes in a frame for shift_out_frame()"""
+        return len(self._buf)
+
+    def prepare_frames(self, frames):
+        """Converts a buffer of frames to the order they're shifted out in
+        for shift_out_frame(). Each frame is frame_size bytes with the pin
+        values in big-endian order (e.g. int.to_bytes(value, n, 'big')).
+        Returns frames unchanged if no conversion is needed."""
+        reversed_bits = self._reversed_bits
+        if reversed_bits is None:
+            return frames
+        n = len(self._buf)
+        prepared = bytearray(len(frames))
+        for start in range(0, len(frames), n):
+            end = start + n - 1
+            for i in range(n):
+                prepared[start + i] = reversed_bits[frames[end - i]]
+        return prepared
+
+    def shift_out_frame(self, frame):
+        """Shifts out and latches a frame_size buffer from prepare_frames().
+
+        This is the fastest way to shift out. It doesn't allocate with either
+        backend, so it can be called from a hard IRQ, but the pin values are
+        not updated, so int(sr) and sr[i] return the values from before. The
+        next shift_out() always shifts out.
+        """
+        self._latched_values = None
+        self._shift(frame)
+
+        self._latch_pin.on()
+        self._latch_pin.off()
+
+    def _pack(self, data):
+        """Packs data into self._buf in the order the bytes are shifted out.
+        Each byte is shifted out MSB first, so for LSB_FIRST the byte order
+        and the bits in each byte are reversed."""
+        buf = self._buf
+        reversed_bits = self._reversed_bits
+        if reversed_bits is None:
+            for i in range(len(buf) - 1, -1, -1):
+                buf[i] = data & 0xff
+                data >>= 8
+        else:
+            for i in range(len(buf)):
+                buf[i] = reversed_bits[data & 0xff]
+                data >>= 8
+
+    def _shift_bits(self, buf):
+        # Look up each bit in a table and use the bound methods created in
+        # __init__ so the inner loop is only the three pin calls
+        byte_bits = self._byte_bits
+        data_value = self._data_value
+        clock_on = self._clock_on
+        clock_off = self._clock_off
+        for byte in buf:
+            start = byte << 3
+            for i in range(start, start + 8):
+                data_value(byte_bits[i])
+                clock_on()
+                clock_off()
+
+    def _shift_spi(self, buf):
+        self._spi.write(buf)
@@ -0,0 +1,117 @@
+import utime
+
+
+class ShiftRegisterAnimation:
+    """Plays sequences of frames on a ShiftRegisterSIPO at a fixed rate.
+
+    A sequence is a bytes, bytearray or memoryview of frames, each
+    shift_register.frame_size bytes with the pin values in big-endian order.
+    Sequences are double buffered: load() while a sequence is playing queues
+    the new sequence and it starts when the current one ends. The frames are
+    prepared when loaded so playing them doesn't allocate.
+
+    Call tick() at the frame rate (e.g. start() with a machine.Timer) or run
+    run() as a uasyncio task.
+    """
+
+    def __init__(self, shift_register):
+        self._shift_register = shift_register
+        # Frames and loop flag of the playing and queued sequences
+        self._frames = None
+        self._loop = False
+        self._next_frames = None
+        self._next_loop = False
+        self._index = 0
+        self._last_frame = None
+        self._timer = None
+
+    def load(self, frames, loop=False):
+        """Queue a sequence of frames. If loop is True the sequence repeats
+        until another sequence is loaded."""
+        sr = self._shift_register
+        size = sr.frame_size
+        if not len(frames) or len(frames) % size:
+            raise ValueError('frames must be a multiple of %d bytes' % size)
+        prepared = memoryview(sr.prepare_frames(frames))
+        frames = memoryview(frames)
+        views = []
+        for start in range(0, len(prepared), size):
+            views.append((prepared[start:start + size],
+                          frames[start:start + size]))
+        if self._frames is None:
+            self._frames = views
+            self._loop = loop
+            self._index = 0
+        else:
+            self._next_frames = views
+            self._next_loop = loop
+
+    @property
+    def playing(self):
+        return self._frames is not None
+
+    def tick(self):
+        """Shift out the next frame. Returns False when there are no more
+        frames to play."""
+        frames = self._frames
+        if frames is None:
+            return False
+        frame = frames[self._index]
+        self._shift_register.shift_out_frame(frame[0])
+        self._last_frame = frame[1]
+        self._index += 1
+        if self._index == len(frames):
+            self._index = 0
+            if self._next_frames is not None:
+                self._frames = self._next_frames
+                self._loop = self._next_loop
+                self._next_frames = None
+            elif not self._loop:
+                self._frames = None
+        return True
+
+    def _timer_callback(self, timer):
+        # Only stop the timer here. stop() allocates to update the pin values
+        # which isn't allowed in a hard interrupt.
+        if not self.tick():
+            timer.deinit()
+
+    def start(self, timer, fps):
+        """Play the loaded frames at fps frames per second using a
+        machine.Timer. The timer is stopped when there are no more frames but
+        call stop() to update the shift register's pin values."""
+        from machine import Timer
+        self._timer = timer
+        timer.init(freq=fps, mode=Timer.PERIODIC,
+                   callback=self._timer_callback)
+
+    def stop(self):
+        """Stop playing and clear the loaded frames. The shift register's pin
+        values are updated to the last frame shown."""
+        if self._timer is not None:
+            self._timer.deinit()
+            self._timer = None
+        self._frames = None
+        self._next_frames = None
+        self._index = 0
+        if self._last_frame is not None:
+            self._shift_register.shift_out(
+                int.from_bytes(self._last_frame, 'big'))
+            self._last_frame = None
+
+    async def run(self, fps):
+        """Play the loaded frames at fps frames per second until there are no
+        more frames. Frames are scheduled from the start time so delays in
+        the event loop don't add up."""
+        import uasyncio
+        period_ms = 1000 // fps
+        next_ms = utime.ticks_ms()
+        while self.tick():
+            next_ms = utime.ticks_add(next_ms, period_ms)
+            delay = utime.ticks_diff(next_ms, utime.ticks_ms())
+            if delay < 0:
+                # Fell behind, reschedule from now instead of catching up
+                next_ms = utime.ticks_ms()
+                delay = 0
+            await uasyncio.sleep_ms(delay)
+        self.stop()
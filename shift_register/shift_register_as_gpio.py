@@ -59,17 +59,28 @@ class ShiftRegisterSIPO_as_GPIO(ShiftRegisterSIPO):
         """Return true if the specified pin is pulled low."""
         return self.input(pin) == LOW
 
+    def output_mask(self, set_mask, clear_mask=0):
+        """Set the pins in set_mask high and the pins in clear_mask low with
+        one shift out. Pins in both masks are set high."""
+        self.shift_out((int(self) & ~clear_mask) | set_mask)
+
+    def read_mask(self, mask=-1):
+        """Return the values of the pins in mask as a bit mask."""
+        return int(self) & mask
+
     def output_pins(self, pins):
         """Set multiple pins high or low at once.  Pins should be a dict of pin
         name to pin value (HIGH/True for 1, LOW/False for 0). All provided pins
         will be set to the given values.
         """
-        data = int(self)
-        for pin, value in iter(pins.items()):
-            data ^= (-value ^ data) & (1 << pin)
-
-        # print('output_pins 0b{:08b} {}'.format(data, pins))
-        self.shift_out(data)
+        set_mask = 0
+        clear_mask = 0
+        for pin in pins:
+            if pins[pin]:
+                set_mask |= 1 << pin
+            else:
+                clear_mask |= 1 << pin
+        self.output_mask(set_mask, clear_mask)
 
     def setup_pins(self, pins):
         """Setup multiple pins as inputs or outputs at once.
@@ -87,8 +98,8 @@ class ShiftRegisterSIPO_as_GPIO(ShiftRegisterSIPO):
         GPIO.HIGH/True if the pin is pulled high, or GPIO.LOW/False if
         pulled low.
         """
-        # General implementation that can be optimized by derived classes.
-        return [self.input(pin) for pin in pins]
+        data = self.read_mask()
+        return [(data >> pin) & 1 for pin in pins]
 
     def add_event_detect(self, pin, edge):
         """Enable edge detection events for a particular GPIO channel.
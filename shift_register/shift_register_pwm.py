@@ -0,0 +1,113 @@
+class ShiftRegisterPWM:
+    """Software PWM for the outputs of a ShiftRegisterSIPO using Binary Code
+    Modulation (BCM).
+
+    Each output has a duty cycle from 0 to 2 ** bits - 1. The duty cycles are
+    kept as bit planes, where plane n has the outputs whose duty cycle has bit
+    n set. Plane n is shown for 2 ** n ticks, so a full cycle is
+    2 ** bits - 1 ticks but only needs one shift per plane (repeated planes
+    aren't shifted out again).
+
+    Call tick() at a fixed rate (e.g. start() with a machine.Timer) or run
+    run() as a uasyncio task. While running, the outputs are controlled by
+    the duty cycles so don't set the shift register's pin values directly.
+    The planes are shifted out with ShiftRegisterSIPO.shift_out_frame(), so
+    the shift register's pin values (int(sr), sr[i]) aren't updated.
+    """
+
+    def __init__(self, shift_register, bits=4):
+        if not 1 <= bits <= 8:
+            raise ValueError('bits must be between 1 and 8')
+        self._shift_register = shift_register
+        self._bits = bits
+        self._max_duty = (1 << bits) - 1
+        self._duty = bytearray(len(shift_register))
+        # Bit planes as frames for shift_out_frame(), so tick() doesn't
+        # allocate and can run in a hard IRQ with any number of chips
+        n = shift_register.frame_size
+        self._planes = [bytearray(n) for _ in range(bits)]
+        # Byte and bit of each output in a frame
+        self._pin_byte = bytearray(len(shift_register))
+        self._pin_mask = bytearray(len(shift_register))
+        for pin in range(len(shift_register)):
+            frame = shift_register.prepare_frames(
+                (1 << pin).to_bytes(n, 'big'))
+            for i in range(n):
+                if frame[i]:
+                    self._pin_byte[pin] = i
+                    self._pin_mask[pin] = frame[i]
+        # Plane last shifted out, -1 if it has to be shifted out again
+        self._shown = -1
+        # Plane to show on each tick of a cycle
+        self._schedule = bytearray(self._max_duty)
+        i = 0
+        for plane in range(bits):
+            for _ in range(1 << plane):
+                self._schedule[i] = plane
+                i += 1
+        self._tick = 0
+        self._timer = None
+
+    @property
+    def max_duty(self):
+        return self._max_duty
+
+    def duty(self, pin, value=None):
+        """Get or set the duty cycle of an output (0 to max_duty)."""
+        if value is None:
+            return self._duty[pin]
+        value = max(0, min(self._max_duty, value))
+        self._duty[pin] = value
+        i = self._pin_byte[pin]
+        mask = self._pin_mask[pin]
+        planes = self._planes
+        for plane in range(self._bits):
+            if (value >> plane) & 1:
+                planes[plane][i] |= mask
+            else:
+                planes[plane][i] &= ~mask
+        self._shown = -1
+
+    def duty_all(self, values):
+        """Set the duty cycle of every output from a sequence of values."""
+        for pin, value in enumerate(values):
+            self.duty(pin, value)
+
+    def tick(self):
+        """Shift out the bit plane for the next tick of the cycle."""
+        i = self._tick
+        plane = self._schedule[i]
+        if plane != self._shown:
+            self._shift_register.shift_out_frame(self._planes[plane])
+            self._shown = plane
+        i += 1
+        self._tick = 0 if i == self._max_duty else i
+
+    def _timer_callback(self, timer):
+        self.tick()
+
+    def start(self, timer, freq):
+        """Call tick() freq times per second using a machine.Timer. Each
+        output cycles at freq / max_duty Hz."""
+        from machine import Timer
+        self._timer = timer
+        timer.init(freq=freq, mode=Timer.PERIODIC,
+                   callback=self._timer_callback)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.deinit()
+            self._timer = None
+
+    async def run(self, tick_ms=1):
+        """Show each bit plane for its share of the cycle forever. Plane n
+        is shown for tick_ms * 2 ** n milliseconds, so a cycle takes
+        tick_ms * max_duty milliseconds."""
+        import uasyncio
+        shift_out_frame = self._shift_register.shift_out_frame
+        planes = self._planes
+        while True:
+            for plane in range(self._bits):
+                shift_out_frame(planes[plane])
+                self._shown = plane
+                await uasyncio.sleep_ms(tick_ms << plane)
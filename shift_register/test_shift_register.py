@@ -1,3 +1,5 @@
+import uasyncio
+from machine import SPI
 from shift_register import ShiftRegisterSIPO
 
 
@@ -25,6 +27,139 @@ def main():
 
     assert len(sr) == 8
 
+    # Check daisy-chained shift registers are shifted as one
+    sr = ShiftRegisterSIPO(data_pin_id=13,
+                           clock_pin_id=14,
+                           latch_pin_id=15,
+                           initial_pin_values=0x8001,
+                           num_chips=2)
+    assert len(sr) == 16
+    assert sr[0] == 1
+    assert sr[15] == 1
+    assert str(sr) == '0b1000000000000001'
+
+    for i in range(16):
+        sr[i] = 1
+        assert sr[i] == 1
+    assert int(sr) == 0xffff
+
+    # Check data is sent MSB first using SPI
+    spi = SPI(1)
+    sr = ShiftRegisterSIPO.from_spi(spi, latch_pin_id=15,
+                                    initial_pin_values=0x0102,
+                                    num_chips=2)
+    assert spi.writes[-1] == b'\x01\x02'
+    sr[15] = 1
+    assert spi.writes[-1] == b'\x81\x02'
+    sr.shift_out(0x00ff)
+    assert spi.writes[-1] == b'\x00\xff'
+    assert int(sr) == 0x00ff
+
+    # Check LSB_FIRST reverses the order the bits are sent in
+    spi = SPI(1)
+    sr = ShiftRegisterSIPO.from_spi(spi, latch_pin_id=15,
+                                    initial_pin_values=0x0102,
+                                    bit_order=ShiftRegisterSIPO.LSB_FIRST,
+                                    num_chips=2)
+    assert spi.writes[-1] == b'\x40\x80'
+    assert int(sr) == 0x0102
+    for pin_values in range(0xff):
+        sr.shift_out(pin_values)
+        assert int(sr) == pin_values
+        sent = spi.writes[-1][0]
+        for i in range(8):
+            assert (sent >> (7 - i)) & 1 == sr[i]
+        assert spi.writes[-1][1] == 0
+
+    sr = ShiftRegisterSIPO(data_pin_id=13,
+                           clock_pin_id=14,
+                           latch_pin_id=15,
+                           bit_order=ShiftRegisterSIPO.LSB_FIRST)
+    for pin_values in range(0xff):
+        sr.shift_out(pin_values)
+        assert int(sr) == pin_values
+
+    # Check changes made in a batch are shifted out once at the end
+    spi = SPI(1)
+    sr = ShiftRegisterSIPO.from_spi(spi, latch_pin_id=15)
+    num_writes = len(spi.writes)
+    with sr.batch():
+        for i in range(8):
+            sr[i] = 1
+            assert sr[i] == 1
+        with sr.batch():
+            sr[0] = 0
+        assert len(spi.writes) == num_writes
+    assert len(spi.writes) == num_writes + 1
+    assert spi.writes[-1] == b'\xfe'
+
+    sr.hold()
+    sr.shift_out(0x0f)
+    assert len(spi.writes) == num_writes + 1
+    sr.commit()
+    assert len(spi.writes) == num_writes + 2
+    assert spi.writes[-1] == b'\x0f'
+
+    # Check unchanged pin values are not shifted out again
+    shifts_executed = sr.shifts_executed
+    shifts_skipped = sr.shifts_skipped
+    sr.shift_out(0x0f)
+    sr[0] = 1
+    with sr.batch():
+        sr[0] = 0
+        sr[0] = 1
+    assert len(spi.writes) == num_writes + 2
+    assert sr.shifts_executed == shifts_executed
+    assert sr.shifts_skipped == shifts_skipped + 3
+
+    sr.refresh()
+    assert len(spi.writes) == num_writes + 3
+    assert spi.writes[-1] == b'\x0f'
+    assert sr.shifts_executed == shifts_executed + 1
+
+    # Check shift_out_async shifts out one chip at a time
+    spi = SPI(1)
+    sr = ShiftRegisterSIPO.from_spi(spi, latch_pin_id=15, num_chips=3)
+    num_writes = len(spi.writes)
+    uasyncio.run(sr.shift_out_async(0x010203))
+    assert spi.writes[num_writes:] == [b'\x01', b'\x02', b'\x03']
+    assert int(sr) == 0x010203
+    uasyncio.run(sr.shift_out_async(0x010203))
+    assert len(spi.writes) == num_writes + 3
+
+    # Check changes made while shifting out asynchronously are shifted out
+    # after it, not in between the chips
+    async def interleave():
+        task = uasyncio.create_task(sr.shift_out_async(0x0a0b0c))
+        await uasyncio.sleep_ms(0)
+        sr[0] = 1
+        await task
+
+    num_writes = len(spi.writes)
+    uasyncio.run(interleave())
+    assert spi.writes[num_writes:] == [b'\x0a', b'\x0b', b'\x0c',
+                                       b'\x0a\x0b\x0d']
+    assert int(sr) == 0x0a0b0d
+    sr.shift_out(0x0a0b0c)
+    assert spi.writes[-1] == b'\x0a\x0b\x0c'
+
+    # Check the refresh task coalesces changes into one shift
+    async def refresh():
+        task = uasyncio.create_task(sr.run_refresh(interval_ms=10))
+        await uasyncio.sleep_ms(0)
+        num_writes = len(spi.writes)
+        for i in range(24):
+            sr[i] = 1
+        assert len(spi.writes) == num_writes
+        await uasyncio.sleep_ms(50)
+        assert spi.writes[num_writes:] == [b'\xff', b'\xff', b'\xff']
+        task.cancel()
+        await uasyncio.sleep_ms(0)
+
+    uasyncio.run(refresh())
+    sr[0] = 0
+    assert spi.writes[-1] == b'\xff\xff\xfe'
+
 
 if __name__ == '__main__':
     main()
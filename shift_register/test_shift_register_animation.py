@@ -0,0 +1,65 @@
+from machine import SPI
+from shift_register import ShiftRegisterSIPO
+from shift_register_animation import ShiftRegisterAnimation
+
+
+def main():
+    spi = SPI(1)
+    sr = ShiftRegisterSIPO.from_spi(spi, latch_pin_id=15, num_chips=2)
+    assert sr.frame_size == 2
+    anim = ShiftRegisterAnimation(sr)
+    assert not anim.playing
+    assert not anim.tick()
+
+    # Check frames are shifted out in order
+    anim.load(b'\x00\x01\x00\x02\x00\x04')
+    assert anim.playing
+    num_writes = len(spi.writes)
+    while anim.tick():
+        pass
+    assert spi.writes[num_writes:] == [b'\x00\x01', b'\x00\x02', b'\x00\x04']
+    assert not anim.playing
+
+    # Check pin values are updated when stopped
+    anim.stop()
+    assert int(sr) == 0x0004
+
+    # Check a sequence loaded while playing starts after the current one
+    anim.load(bytearray(b'\x01\x00\x02\x00'), loop=True)
+    anim.tick()
+    anim.load(memoryview(b'\x80\x00'))
+    num_writes = len(spi.writes)
+    while anim.tick():
+        pass
+    assert spi.writes[num_writes:] == [b'\x02\x00', b'\x80\x00']
+
+    # Check looping sequences repeat
+    anim.load(b'\x00\x01\x00\x02', loop=True)
+    num_writes = len(spi.writes)
+    for _ in range(5):
+        assert anim.tick()
+    assert spi.writes[num_writes:] == [b'\x00\x01', b'\x00\x02'] * 2 + \
+        [b'\x00\x01']
+    anim.stop()
+    assert not anim.playing
+    assert int(sr) == 0x0001
+
+    # Check frames are reversed for LSB_FIRST
+    sr = ShiftRegisterSIPO.from_spi(spi, latch_pin_id=15, num_chips=2,
+                                    bit_order=ShiftRegisterSIPO.LSB_FIRST)
+    anim = ShiftRegisterAnimation(sr)
+    anim.load(b'\x01\x02')
+    anim.tick()
+    assert spi.writes[-1] == b'\x40\x80'
+    anim.stop()
+    assert int(sr) == 0x0102
+
+    try:
+        anim.load(b'\x00')
+        assert False
+    except ValueError:
+        pass
+
+
+if __name__ == '__main__':
+    main()
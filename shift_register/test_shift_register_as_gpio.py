@@ -1,4 +1,4 @@
-from shift_register_as_gpio import ShiftRegisterSIPO_as_GPIO
+from shift_register_as_gpio import ShiftRegisterSIPO_as_GPIO, HIGH, LOW
 
 
 def main():
@@ -49,6 +49,34 @@ def main():
         sr.output(i, 0)
         assert sr.input(i) == 0
 
+    #
+    # Test multi-pin output and input
+    #
+
+    sr.shift_out(0x0f)
+    sr.output_mask(0xc0, 0x03)
+    assert int(sr) == 0xcc
+    assert sr.read_mask(0xf0) == 0xc0
+    assert sr.read_mask() == 0xcc
+
+    sr.output_pins({0: HIGH, 1: True, 2: 1, 3: LOW, 6: False, 7: 0})
+    assert int(sr) == 0x07
+    assert sr.input_pins([0, 3, 2, 7]) == [1, 0, 1, 0]
+
+    # Check a multi-pin output is one shift out
+    shifts_executed = sr.shifts_executed
+    sr.output_pins(dict((i, i < 4) for i in range(8)))
+    assert int(sr) == 0x0f
+    assert sr.shifts_executed == shifts_executed + 1
+
+    # Test output in a batch
+    sr.shift_out(0x00)
+    with sr.batch():
+        for i in range(8):
+            sr.output(i, i % 2)
+            assert sr.input(i) == i % 2
+    assert int(sr) == 0xaa
+
 
 if __name__ == '__main__':
     main()
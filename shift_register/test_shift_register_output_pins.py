@@ -87,6 +87,15 @@ def main():
         assert sr[i] == 0
         assert other_pins_unchanged(i)
 
+    # Check Pin objects can be updated together in a batch
+    sr.shift_out(0)
+    pins = [sr.get_output_pin(i) for i in range(8)]
+    with sr.batch():
+        for pin in pins:
+            pin.on()
+            assert pin.value() == 1
+    assert int(sr) == 0xff
+
 
 if __name__ == '__main__':
     main()
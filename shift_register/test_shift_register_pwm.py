@@ -0,0 +1,65 @@
+from machine import SPI
+from shift_register import ShiftRegisterSIPO
+from shift_register_pwm import ShiftRegisterPWM
+
+
+def pin_values(sr, frame):
+    """Returns the pin values of a frame as shifted out."""
+    if sr._reversed_bits is None:
+        return int.from_bytes(frame, 'big')
+    return int.from_bytes(bytes([sr._reversed_bits[b] for b in frame]),
+                          'little')
+
+
+def main():
+    for bit_order in (ShiftRegisterSIPO.MSB_FIRST,
+                      ShiftRegisterSIPO.LSB_FIRST):
+        spi = SPI(1)
+        sr = ShiftRegisterSIPO.from_spi(spi, latch_pin_id=15,
+                                        bit_order=bit_order, num_chips=2)
+        pwm = ShiftRegisterPWM(sr, bits=4)
+        assert pwm.max_duty == 15
+
+        # Check duty cycles are stored and clamped
+        pwm.duty_all(range(16))
+        for i in range(16):
+            assert pwm.duty(i) == i
+        pwm.duty(0, 20)
+        assert pwm.duty(0) == 15
+        pwm.duty(0, 0)
+
+        # Check each output is on for duty ticks of a cycle
+        on_ticks = [0] * 16
+        num_writes = len(spi.writes)
+        for _ in range(pwm.max_duty):
+            pwm.tick()
+            values = pin_values(sr, spi.writes[-1])
+            for i in range(16):
+                on_ticks[i] += (values >> i) & 1
+        assert on_ticks == list(range(16))
+
+        # Check repeated bit planes aren't shifted out again
+        assert len(spi.writes) - num_writes == 4
+
+        # Check the next cycle starts from the first bit plane
+        pwm.duty_all([0] * 16)
+        pwm.duty(3, 1)
+        pwm.tick()
+        assert pin_values(sr, spi.writes[-1]) == 1 << 3
+        pwm.tick()
+        assert pin_values(sr, spi.writes[-1]) == 0
+
+    # Check 32 outputs can be driven with the bit-banged backend
+    sr = ShiftRegisterSIPO(data_pin_id=13,
+                           clock_pin_id=14,
+                           latch_pin_id=15,
+                           num_chips=4)
+    pwm = ShiftRegisterPWM(sr, bits=2)
+    pwm.duty(31, 3)
+    for _ in range(pwm.max_duty * 2):
+        pwm.tick()
+    assert pwm.duty(31) == 3
+
+
+if __name__ == '__main__':
+    main()
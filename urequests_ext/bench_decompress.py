@@ -0,0 +1,71 @@
+"""Compares wire bytes and time of plain and gzip compressed JSON
+responses. Runs against the stand-in server so it doesn't need a network:
+
+    micropython bench_decompress.py
+
+Compressing the payloads needs the deflate module (MicroPython 1.21+) or
+zlib.compressobj.
+"""
+import ujson
+import utime
+import urequests_ext
+from stub_server import StubServer, response
+
+ITERATIONS = 20
+
+PAYLOADS = (
+    ('status', {'ok': True, 'uptime': 123456}),
+    ('config', {'interval': 60, 'server': 'telemetry.example.com',
+                'sensors': [{'id': i, 'enabled': True, 'name': 'sensor%d' % i}
+                            for i in range(16)]}),
+    ('readings', {'readings': [{'t': 1700000000 + i * 60, 'temp': 21.5,
+                                'humidity': 40} for i in range(100)]}),
+)
+
+
+def gzip(data, wbits):
+    try:
+        import deflate
+        import uio
+        f = uio.BytesIO()
+        with deflate.DeflateIO(f, deflate.GZIP, wbits) as d:
+            d.write(data)
+        return f.getvalue()
+    except ImportError:
+        import zlib
+        c = zlib.compressobj(9, zlib.DEFLATED, wbits + 16)
+        return c.compress(data) + c.flush()
+
+
+def run(url, decompress):
+    urequests_ext.get(url, decompress=decompress).close()
+    start = utime.ticks_us()
+    for _ in range(ITERATIONS):
+        urequests_ext.get(url, decompress=decompress).json()
+    return utime.ticks_diff(utime.ticks_us(), start) // ITERATIONS
+
+
+def main():
+    server = StubServer()
+    urequests_ext.usocket = server
+    for name, payload in PAYLOADS:
+        body = ujson.dumps(payload).encode()
+        plain = response(200, body, {'Content-Type': 'application/json'})
+        server.route('/' + name, plain)
+        print('{:10s} {:13s} {:6d} wire bytes {:6d} us'.format(
+            name, 'plain', len(plain),
+            run('http://example.com/' + name, False)))
+        for wbits in (9, 15):
+            path = '/%s-%d' % (name, wbits)
+            compressed = response(200, gzip(body, wbits),
+                                  {'Content-Type': 'application/json',
+                                   'Content-Encoding': 'gzip'})
+            server.route(path, compressed)
+            urequests_ext.decompress_wbits = wbits
+            print('{:10s} {:13s} {:6d} wire bytes {:6d} us'.format(
+                name, 'gzip wbits %d' % wbits, len(compressed),
+                run('http://example.com' + path, True)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Counts the socket writes and bytes written per request. Runs against
+the stand-in server so it doesn't need a network:
+
+    micropython bench_request_writes.py
+"""
+import urequests_ext
+from stub_server import StubServer, response
+
+REQUESTS = (
+    ('GET', 'http://example.com/status', {}, None),
+    ('GET', 'http://example.com/config',
+     {'Accept': 'application/json', 'User-Agent': 'micropython'}, None),
+    ('POST', 'http://example.com/telemetry',
+     {'Content-Type': 'application/json'},
+     '{"temp": 21.5, "humidity": 40, "battery": 3.71}'),
+    ('POST', 'http://example.com/upload',
+     {'Content-Type': 'application/octet-stream'}, b'x' * 1024),
+)
+
+
+def main():
+    server = StubServer()
+    urequests_ext.usocket = server
+    for method, url, headers, data in REQUESTS:
+        server.route('/' + url.split('/', 3)[3], response(204))
+        urequests_ext.request(method, url, data=data, headers=headers).close()
+        writes = server.sockets[-1].writes
+        print('{:4s} {:30s} {:2d} writes {:5d} bytes'.format(
+            method, url, len(writes), sum([len(w) for w in writes])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""Stand-in HTTP server for testing urequests_ext without a network.
+
+StubServer replaces the usocket module used by urequests_ext:
+
+    server = StubServer()
+    server.route('/hello', response(200, b'Hello'))
+    urequests_ext.usocket = server
+
+Requests written to a StubSocket are parsed and answered from the routes.
+Connections stay open (HTTP/1.1 keep-alive) until the client closes them
+or the server closes them with close_all().
+
+For urequests_ext.aio, open_connection replaces uasyncio.open_connection:
+
+    aio._open_connection = server.open_connection
+"""
+
+
+def response(status=200, body=b'', headers=None, reason='OK',
+             version='HTTP/1.1'):
+    """Returns the bytes of a HTTP response. Content-Length is added unless
+    headers has Content-Length or Transfer-Encoding."""
+    head = '%s %d %s\r\n' % (version, status, reason)
+    headers = headers or {}
+    names = [k.lower() for k in headers]
+    if 'content-length' not in names and 'transfer-encoding' not in names:
+        head += 'Content-Length: %d\r\n' % len(body)
+    for k in headers:
+        head += '%s: %s\r\n' % (k, headers[k])
+    return head.encode() + b'\r\n' + body
+
+
+class Request:
+    def __init__(self, method, path, version, headers, body):
+        self.method = method
+        self.path = path
+        self.version = version
+        # Header names are lowercase
+        self.headers = headers
+        self.body = body
+
+
+class StubServer:
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.sockets = []
+        self.connections = 0
+        self.lookups = 0
+        # Delay before each read from a stream, and the most streams that
+        # were open at the same time
+        self.stream_delay_ms = 0
+        self.open_streams = 0
+        self.max_open_streams = 0
+
+    def route(self, path, resp):
+        """Answer requests for path with resp, either the bytes of a
+        response or a function that takes a Request and returns them."""
+        self.routes[path] = resp
+
+    def handle(self, request):
+        self.requests.append(request)
+        resp = self.routes.get(request.path)
+        if resp is None:
+            return response(404, b'Not Found', reason='Not Found')
+        if callable(resp):
+            return resp(request)
+        return resp
+
+    def close_all(self):
+        """Close all connections from the server side."""
+        for s in self.sockets:
+            s.closed_by_server = True
+
+    # usocket module interface
+
+    def getaddrinfo(self, host, port, *args):
+        self.lookups += 1
+        return [(2, 1, 0, '', (host, port))]
+
+    def socket(self, *args):
+        s = StubSocket(self)
+        self.sockets.append(s)
+        return s
+
+    # uasyncio.open_connection
+
+    async def open_connection(self, host, port, ssl=None):
+        self.getaddrinfo(host, port)
+        s = self.socket()
+        s.connect((host, port))
+        stream = StubStream(s)
+        return stream, stream
+
+
+class StubStream:
+    """uasyncio stream over a StubSocket."""
+
+    def __init__(self, s):
+        self.s = s
+        server = s.server
+        server.open_streams += 1
+        server.max_open_streams = max(server.max_open_streams,
+                                      server.open_streams)
+
+    async def _delay(self):
+        if self.s.server.stream_delay_ms:
+            import uasyncio
+            await uasyncio.sleep_ms(self.s.server.stream_delay_ms)
+
+    async def readline(self):
+        await self._delay()
+        return self.s.readline()
+
+    async def read(self, n=-1):
+        await self._delay()
+        return self.s.read(n)
+
+    async def readexactly(self, n):
+        await self._delay()
+        data = self.s.read(n)
+        if len(data) < n:
+            raise EOFError
+        return data
+
+    def write(self, buf):
+        self.s.write(buf)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        if not self.s.closed:
+            self.s.server.open_streams -= 1
+        self.s.close()
+
+    async def wait_closed(self):
+        pass
+
+
+class StubSocket:
+    def __init__(self, server):
+        self.server = server
+        self.connected = False
+        self.closed = False
+        self.closed_by_server = False
+        self.timeout = None
+        self.writes = []
+        self._request = b''
+        self._response = b''
+
+    def connect(self, addr):
+        self.server.connections += 1
+        self.connected = True
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def close(self):
+        self.closed = True
+
+    def write(self, buf):
+        if self.closed or self.closed_by_server:
+            raise OSError(32)  # EPIPE
+        if isinstance(buf, str):
+            buf = buf.encode()
+        buf = bytes(buf)
+        self.writes.append(buf)
+        self._request += buf
+        while self._handle_request():
+            pass
+        return len(buf)
+
+    def _handle_request(self):
+        end = self._request.find(b'\r\n\r\n')
+        if end < 0:
+            return False
+        lines = self._request[:end].decode().split('\r\n')
+        method, path, version = lines[0].split(' ')
+        headers = {}
+        for line in lines[1:]:
+            k, v = line.split(':', 1)
+            headers[k.strip().lower()] = v.strip()
+        start = end + 4
+        if 'content-length' in headers:
+            end = start + int(headers['content-length'])
+            if len(self._request) < end:
+                return False
+            body = self._request[start:end]
+        elif headers.get('transfer-encoding') == 'chunked':
+            body = b''
+            end = start
+            while True:
+                i = self._request.find(b'\r\n', end)
+                if i < 0:
+                    return False
+                size = int(self._request[end:i].split(b';')[0], 16)
+                if len(self._request) < i + 2 + size + 2:
+                    return False
+                body += self._request[i + 2:i + 2 + size]
+                end = i + 2 + size + 2
+                if not size:
+                    break
+        else:
+            end = start
+            body = b''
+        self._request = self._request[end:]
+        request = Request(method, path, version, headers, body)
+        self._response += self.server.handle(request)
+        return True
+
+    def _available(self):
+        if self.closed_by_server:
+            self._response = b''
+        return self._response
+
+    def read(self, n=-1):
+        data = self._available()
+        if n is None or n < 0:
+            n = len(data)
+        data, self._response = data[:n], data[n:]
+        return data
+
+    def readinto(self, buf, n=None):
+        if n is None:
+            n = len(buf)
+        data = self.read(n)
+        buf[:len(data)] = data
+        return len(data)
+
+    def readline(self, limit=-1):
+        data = self._available()
+        i = data.find(b'\n')
+        n = len(data) if i < 0 else i + 1
+        if limit is not None and 0 <= limit < n:
+            n = limit
+        return self.read(n)
@@ -0,0 +1,1103 @@
+import uerrno
+import urequests_ext
+from urequests_ext import jsonstream
+from urequests_ext.pool import ConnectionPool
+from stub_server import StubServer, response
+
+
+def test_request(server):
+    server.route('/hello', response(200, b'Hello'))
+    r = urequests_ext.get('http://example.com/hello')
+    assert r.status_code == 200
+    assert r.reason == b'OK'
+    assert r.text == 'Hello'
+    request = server.requests[-1]
+    assert request.method == 'GET'
+    assert request.path == '/hello'
+    assert request.version == 'HTTP/1.0'
+    assert request.headers['host'] == 'example.com'
+
+    r = urequests_ext.post('http://example.com/hello', json={'a': 1})
+    assert r.status_code == 200
+    r.close()
+    assert server.requests[-1].body == b'{"a": 1}'
+
+    r = urequests_ext.get('http://example.com/missing')
+    assert r.status_code == 404
+    r.close()
+
+    # Check the request head and small bodies are written at once
+    r = urequests_ext.post('http://example.com/hello', data='x' * 10,
+                           headers={'Content-Type': 'text/plain'})
+    r.close()
+    assert len(server.sockets[-1].writes) == 1
+    request = server.requests[-1]
+    assert request.headers['content-type'] == 'text/plain'
+    assert request.headers['content-length'] == '10'
+    assert request.body == b'x' * 10
+
+    # Check heads and bodies larger than the buffer are written in full
+    size = urequests_ext.HEAD_BUF_SIZE
+    r = urequests_ext.post('http://example.com/hello', data=b'y' * size,
+                           headers={'X-Long': 'z' * size, 'X-Short': '1'})
+    r.close()
+    request = server.requests[-1]
+    assert request.headers['x-long'] == 'z' * size
+    assert request.headers['x-short'] == '1'
+    assert request.body == b'y' * size
+
+
+def test_connection_pool(server):
+    server.route('/hello', response(200, b'Hello'))
+    pool = ConnectionPool(max_size=2, max_per_host=1)
+    connections = server.connections
+
+    # Check connections are reused once the response is read
+    for _ in range(3):
+        r = urequests_ext.get('http://example.com/hello', pool=pool)
+        assert r.text == 'Hello'
+        assert server.requests[-1].version == 'HTTP/1.1'
+    assert server.connections == connections + 1
+
+    # Check a connection is reused if a small body was not read
+    for _ in range(5):
+        urequests_ext.post('http://example.com/hello', data='x',
+                           pool=pool).close()
+    assert server.connections == connections + 1
+
+    # Check a connection is not reused if a large body was not read
+    server.route('/big', response(200, b'x' * (pool.max_drain + 1)))
+    r = urequests_ext.get('http://example.com/big', pool=pool)
+    r.close()
+    r = urequests_ext.get('http://example.com/hello', pool=pool)
+    assert r.text == 'Hello'
+    assert server.connections == connections + 2
+
+    # Check a HEAD response without a body can be reused
+    r = urequests_ext.head('http://example.com/hello', pool=pool)
+    r.close()
+    r = urequests_ext.get('http://example.com/hello', pool=pool)
+    assert r.text == 'Hello'
+    assert server.connections == connections + 2
+
+    # Check a request is retried on a new connection when the server closed
+    # the idle connection
+    server.close_all()
+    r = urequests_ext.get('http://example.com/hello', pool=pool)
+    assert r.text == 'Hello'
+    assert server.connections == connections + 3
+
+    # Check Connection: close responses are not reused
+    server.route('/close', response(200, b'Bye',
+                                    headers={'Connection': 'close'}))
+    r = urequests_ext.get('http://example.com/close', pool=pool)
+    assert r.text == 'Bye'
+    r = urequests_ext.get('http://example.com/hello', pool=pool)
+    assert r.text == 'Hello'
+    assert server.connections == connections + 4
+
+    # Check a request isn't sent again if reading the response on a reused
+    # connection times out
+    def timeout(limit=-1):
+        raise OSError(uerrno.ETIMEDOUT)
+
+    s = server.sockets[-1]
+    s.readline = timeout
+    num_requests = len(server.requests)
+    try:
+        urequests_ext.post('http://example.com/hello', data='x', pool=pool)
+        assert False
+    except OSError as e:
+        assert e.args[0] == uerrno.ETIMEDOUT
+    assert len(server.requests) == num_requests + 1
+    assert s.closed
+
+    # Check the pool size limits
+    r1 = urequests_ext.get('http://example.com/hello', pool=pool)
+    r2 = urequests_ext.get('http://example.com/hello', pool=pool)
+    r3 = urequests_ext.get('http://example.org/hello', pool=pool)
+    r4 = urequests_ext.get('http://example.net/hello', pool=pool)
+    for r in (r1, r2, r3, r4):
+        assert r.text == 'Hello'
+    assert len(pool._idle) == 2
+    assert pool.get(('http:', 'example.com', 80)) is None
+    pool.close()
+    assert len(pool._idle) == 0
+
+    # Check idle connections are closed
+    pool = ConnectionPool(max_idle_ms=0)
+    connections = server.connections
+    for _ in range(2):
+        r = urequests_ext.get('http://example.com/hello', pool=pool)
+        assert r.text == 'Hello'
+    assert server.connections == connections + 2
+    assert server.sockets[-2].closed
+
+    # Check the module's connection_pool is used by default
+    urequests_ext.connection_pool = ConnectionPool()
+    connections = server.connections
+    for _ in range(2):
+        r = urequests_ext.get('http://example.com/hello')
+        assert r.text == 'Hello'
+    assert server.connections == connections + 1
+    r = urequests_ext.get('http://example.com/hello', pool=False)
+    assert r.text == 'Hello'
+    assert server.requests[-1].version == 'HTTP/1.0'
+    urequests_ext.connection_pool.close()
+    urequests_ext.connection_pool = None
+
+
+def test_headers(server):
+    server.route('/headers', response(200, b'{}', headers={
+        'Content-Type': 'application/json',
+        'ETAG': '"abc"',
+        'set-cookie': 'a=1',
+        'Set-Cookie': 'b=2',
+        'X-Padded': '  value \t',
+    }))
+    r = urequests_ext.get('http://example.com/headers')
+    r.close()
+    h = r.headers
+    assert h[b'content-type'] == b'application/json'
+    assert h['Content-Type'] == b'application/json'
+    assert h.get(b'etag') == b'"abc"'
+    assert h.get(b'Content-Length') == b'2'
+    assert h.get(b'x-padded') == b'value'
+    assert h.get(b'x-missing') is None
+    assert h.get(b'x-missing', b'') == b''
+    assert b'ETag' in h
+    assert b'Content-Typ' not in h
+    assert h.get_all(b'set-cookie') == [b'a=1', b'b=2']
+    assert len(h) == 6
+    assert (b'etag', b'"abc"') in h.items()
+    assert b'content-length' in h.keys()
+    try:
+        h[b'x-missing']
+        assert False
+    except KeyError:
+        pass
+
+    # Check redirects have a location
+    server.route('/redirect', response(
+        302, b'Moved', headers={'location': 'http://example.com/headers'},
+        reason='Found'))
+    r = urequests_ext.get('http://example.com/redirect')
+    r.close()
+    assert r.status_code == 302
+    assert r.location == b'http://example.com/headers'
+
+
+def chunked(*chunks):
+    body = b''
+    for chunk in chunks:
+        body += b'%x\r\n' % len(chunk) + chunk + b'\r\n'
+    return body + b'0\r\nX-Trailer: 1\r\n\r\n'
+
+
+def test_chunked(server):
+    server.route('/chunked', response(
+        200, chunked(b'Hello', b', ', b'Wor', b'ld\nLine 2\n', b'3'),
+        headers={'Transfer-Encoding': 'chunked'}))
+
+    r = urequests_ext.get('http://example.com/chunked')
+    assert r.text == 'Hello, World\nLine 2\n3'
+
+    # Check the body can be read in parts across chunk boundaries
+    r = urequests_ext.get('http://example.com/chunked')
+    assert r.raw.read(3) == b'Hel'
+    assert r.raw.read(10) == b'lo'
+    assert r.raw.readline() == b', World\n'
+    buf = bytearray(16)
+    n = r.raw.readinto(buf)
+    assert buf[:n] == b'Line 2\n'
+    assert r.raw.readline() == b'3'
+    assert r.raw.readline() == b''
+    assert r.raw.read() == b''
+    r.close()
+
+    # Check the connection is reused after a chunked body
+    pool = ConnectionPool()
+    connections = server.connections
+    for _ in range(2):
+        r = urequests_ext.get('http://example.com/chunked', pool=pool)
+        assert r.text == 'Hello, World\nLine 2\n3'
+    assert server.connections == connections + 1
+    pool.close()
+
+
+def test_streaming(server):
+    body = b''.join([b'line %d\r\n' % i for i in range(100)])
+    server.route('/lines', response(200, body))
+    server.route('/chunked-lines', response(
+        200, chunked(body[:333], body[333:]),
+        headers={'Transfer-Encoding': 'chunked'}))
+    pool = ConnectionPool()
+
+    for path in ('/lines', '/chunked-lines'):
+        for p in (False, pool):
+            # Check iter_content reuses the buffer
+            buf = bytearray(64)
+            r = urequests_ext.get('http://example.com' + path, pool=p)
+            data = b''
+            for part in r.iter_content(100, buf):
+                assert len(part) <= 64
+                data += part
+            assert data == body
+            assert r.raw is None
+
+            r = urequests_ext.get('http://example.com' + path, pool=p)
+            lines = list(r.iter_lines())
+            assert len(lines) == 100
+            assert lines[42] == b'line 42'
+
+            r = urequests_ext.get('http://example.com' + path, pool=p)
+            buf = bytearray(10)
+            data = b''
+            while True:
+                n = r.readinto(buf)
+                if not n:
+                    break
+                data += buf[:n]
+            r.close()
+            assert data == body
+
+            r = urequests_ext.get('http://example.com' + path, pool=p)
+            assert r.save_to('test_output.tmp') == len(body)
+            with open('test_output.tmp', 'rb') as f:
+                assert f.read() == body
+    pool.close()
+
+    import uos
+    uos.remove('test_output.tmp')
+
+
+def test_json(server):
+    doc = (b'{"name": "Caf\\u00e9 \\"x\\"", "coord": {"lon": -0.13, "lat": 51.51},'
+           b' "weather": [{"id": 300, "main": "Drizzle"}, {"id": 701}],'
+           b' "ok": true, "none": null, "empty": [], "n": 1e3}')
+    server.route('/json', response(200, doc))
+    server.route('/chunked-json', response(
+        200, chunked(doc[:50], doc[50:]),
+        headers={'Transfer-Encoding': 'chunked'}))
+    import ujson
+    expected = ujson.loads(doc)
+    pool = ConnectionPool()
+
+    for path in ('/json', '/chunked-json'):
+        for p in (False, pool):
+            r = urequests_ext.get('http://example.com' + path, pool=p)
+            assert r.json() == expected
+            r = urequests_ext.get('http://example.com' + path, pool=p)
+            assert r.json(stream=True) == expected
+            assert r.raw is None
+
+            r = urequests_ext.get('http://example.com' + path, pool=p)
+            values = jsonstream.select(
+                r.raw, ('name', 'coord.lat', 'weather.1.id', 'ok', 'none',
+                        'n', 'missing'), buf_size=16)
+            r.close()
+            assert values == {
+                'name': 'Caf\u00e9 "x"',
+                'coord.lat': 51.51,
+                'weather.1.id': 701,
+                'ok': True,
+                'none': None,
+                'n': 1000.0,
+            }
+    pool.close()
+
+    r = urequests_ext.get('http://example.com/json')
+    events = list(jsonstream.events(r.raw))
+    r.close()
+    assert events[:5] == [
+        (jsonstream.START_MAP, None),
+        (jsonstream.KEY, 'name'),
+        (jsonstream.VALUE, 'Caf\u00e9 "x"'),
+        (jsonstream.KEY, 'coord'),
+        (jsonstream.START_MAP, None),
+    ]
+    assert events[-1] == (jsonstream.END_MAP, None)
+
+    # Check truncated documents raise instead of giving partial results
+    import uio
+    for doc in (b'[1, 2', b'{"a": {"b": 1}', b'{"a": "x'):
+        try:
+            jsonstream.select(uio.BytesIO(doc), ('a.c',))
+            assert False
+        except ValueError:
+            pass
+    assert jsonstream.select(uio.BytesIO(b' 5 '), ('',)) == {'': 5}
+
+
+def test_dns_cache(server):
+    server.route('/hello', response(200, b'Hello'))
+    urequests_ext.flush_dns_cache()
+
+    # Check lookups are cached per host and port
+    lookups = server.lookups
+    for _ in range(3):
+        urequests_ext.get('http://example.com/hello').close()
+    assert server.lookups == lookups + 1
+    urequests_ext.get('http://example.com:8080/hello').close()
+    assert server.lookups == lookups + 2
+
+    urequests_ext.flush_dns_cache('example.com')
+    urequests_ext.get('http://example.com/hello').close()
+    assert server.lookups == lookups + 3
+
+    # Check entries expire
+    ttl_ms = urequests_ext.dns_cache_ttl_ms
+    urequests_ext.dns_cache_ttl_ms = 0
+    urequests_ext.flush_dns_cache()
+    urequests_ext.get('http://example.com/hello').close()
+    urequests_ext.get('http://example.com/hello').close()
+    assert server.lookups == lookups + 5
+    urequests_ext.dns_cache_ttl_ms = ttl_ms
+
+    # Check the cache size is bounded
+    urequests_ext.flush_dns_cache()
+    for i in range(urequests_ext.dns_cache_size + 2):
+        urequests_ext.resolve('host%d.example.com' % i, 80)
+    assert len(urequests_ext._dns_cache) == urequests_ext.dns_cache_size
+
+    # Check failed lookups are cached
+    getaddrinfo = server.getaddrinfo
+    lookups = []
+
+    def failing_getaddrinfo(host, port):
+        lookups.append(host)
+        raise OSError(-2)
+
+    server.getaddrinfo = failing_getaddrinfo
+    for _ in range(2):
+        try:
+            urequests_ext.get('http://nxdomain.example.com/')
+            assert False
+        except OSError:
+            pass
+    assert lookups == ['nxdomain.example.com']
+    server.getaddrinfo = getaddrinfo
+    urequests_ext.flush_dns_cache()
+
+
+def test_timeouts(server):
+    server.route('/hello', response(200, b'Hello'))
+    server.route('/until-close', b'HTTP/1.0 200 OK\r\n\r\nUntil close')
+
+    # Check the body is read up to Content-Length
+    server.route('/extra', response(200, b'Hello') + b'extra')
+    assert urequests_ext.get('http://example.com/extra').text == 'Hello'
+    r = urequests_ext.get('http://example.com/until-close')
+    assert r.text == 'Until close'
+
+    # Check timeouts are set on the socket
+    urequests_ext.get('http://example.com/hello', timeout=2).close()
+    assert server.sockets[-1].timeout == 2
+    urequests_ext.get('http://example.com/hello', timeout=(1, 5)).close()
+    assert server.sockets[-1].timeout == 5
+
+    # Check the total timeout
+    import utime
+    import uerrno
+    try:
+        urequests_ext.get('http://example.com/hello', total_timeout=0)
+        assert False
+    except OSError as e:
+        assert e.args[0] == uerrno.ETIMEDOUT
+    assert server.sockets[-1].closed
+
+    for path in ('/hello', '/until-close', '/chunked'):
+        r = urequests_ext.get('http://example.com' + path,
+                              total_timeout=0.05)
+        utime.sleep_ms(60)
+        try:
+            r.content
+            assert False
+        except OSError as e:
+            assert e.args[0] == uerrno.ETIMEDOUT
+        r.close()
+        assert server.sockets[-1].closed
+
+    r = urequests_ext.get('http://example.com/hello', total_timeout=5)
+    assert r.text == 'Hello'
+
+
+def test_redirects(server):
+    def redirect(status, location):
+        return response(status, b'Moved', headers={'Location': location})
+
+    server.route('/hello', response(200, b'Hello'))
+    server.route('/a/b', redirect(302, 'c?x=1'))
+    server.route('/a/c?x=1', redirect(307, '/abs'))
+    server.route('/abs', redirect(302, 'http://example.org/hello'))
+    server.route('/loop1', redirect(302, '/loop2'))
+    server.route('/loop2', redirect(302, '/loop1'))
+    server.route('/permanent', redirect(301, '/hello'))
+    server.route('/post', redirect(303, '/hello'))
+    server.route('/post307', redirect(307, '/hello'))
+
+    # Check redirects are only followed if allowed
+    r = urequests_ext.get('http://example.com/a/b')
+    r.close()
+    assert r.status_code == 302
+    assert r.location == b'c?x=1'
+
+    # Check relative and absolute locations are followed
+    num_requests = len(server.requests)
+    r = urequests_ext.get('http://example.com/a/b', allow_redirects=True)
+    assert r.status_code == 200
+    assert r.text == 'Hello'
+    assert [req.path for req in server.requests[num_requests:]] == \
+        ['/a/b', '/a/c?x=1', '/abs', '/hello']
+    assert server.requests[-1].headers['host'] == 'example.org'
+
+    for max_redirects, ok in ((2, False), (3, True)):
+        try:
+            urequests_ext.get('http://example.com/a/b', allow_redirects=True,
+                              max_redirects=max_redirects).close()
+            assert ok
+        except ValueError:
+            assert not ok
+
+    try:
+        urequests_ext.get('http://example.com/loop1', allow_redirects=True)
+        assert False
+    except ValueError:
+        pass
+
+    # Check a redirect without a location is returned
+    server.route('/nolocation', response(302, b'Moved'))
+    r = urequests_ext.get('http://example.com/nolocation',
+                          allow_redirects=True)
+    r.close()
+    assert r.status_code == 302
+
+    # Check a POST can redirect to a GET of the same URL
+    server.route('/form', lambda request: redirect(303, '/form')
+                 if request.method == 'POST' else response(200, b'Done'))
+    r = urequests_ext.post('http://example.com/form', data='x',
+                           allow_redirects=True)
+    assert r.text == 'Done'
+    assert server.requests[-1].method == 'GET'
+
+    # Check the connection is reused for redirects to the same host
+    pool = ConnectionPool()
+    connections = server.connections
+    for _ in range(2):
+        r = urequests_ext.get('http://example.com/a/b', allow_redirects=True,
+                              pool=pool)
+        assert r.text == 'Hello'
+    assert server.connections == connections + 2
+    pool.close()
+
+    # Check permanent redirects are remembered
+    num_requests = len(server.requests)
+    for _ in range(2):
+        r = urequests_ext.get('http://example.com/permanent',
+                              allow_redirects=True)
+        assert r.text == 'Hello'
+    assert [req.path for req in server.requests[num_requests:]] == \
+        ['/permanent', '/hello', '/hello']
+
+    # Check the method is changed to GET for 303 but not for 307
+    r = urequests_ext.post('http://example.com/post', data='x',
+                           allow_redirects=True)
+    r.close()
+    assert server.requests[-1].method == 'GET'
+    assert server.requests[-1].body == b''
+    r = urequests_ext.post('http://example.com/post307', data='x',
+                           allow_redirects=True)
+    r.close()
+    assert server.requests[-1].method == 'POST'
+    assert server.requests[-1].body == b'x'
+
+    # Check bodies that can't be sent again aren't followed unless the
+    # redirect changes to GET
+    def generate():
+        yield b'abc'
+
+    server.route('/put302', redirect(302, '/hello'))
+    for path in ('/post307', '/put302'):
+        num_requests = len(server.requests)
+        r = urequests_ext.put('http://example.com' + path, data=generate(),
+                              allow_redirects=True)
+        r.close()
+        assert r.status_code in (302, 307)
+        assert len(server.requests) == num_requests + 1
+        assert server.requests[-1].body == b'abc'
+    r = urequests_ext.post('http://example.com/post', data=generate(),
+                           allow_redirects=True)
+    assert r.text == 'Hello'
+    assert server.requests[-1].method == 'GET'
+
+    # Check remembered permanent redirects change POST to GET too
+    server.route('/post301', redirect(301, '/hello'))
+    for _ in range(2):
+        r = urequests_ext.post('http://example.com/post301', data='x',
+                               allow_redirects=True)
+        assert r.text == 'Hello'
+        assert server.requests[-1].method == 'GET'
+        assert server.requests[-1].body == b''
+
+    # Check credentials aren't sent to another host
+    server.route('/other', redirect(302, 'http://example.org/hello'))
+    server.route('/same', redirect(302, '/hello'))
+    headers = {'Authorization': 'Bearer secret', b'Cookie': b'a=1',
+               'If-None-Match': '"x"', 'Accept': 'text/plain'}
+    urequests_ext.get('http://example.com/same', headers=headers,
+                      allow_redirects=True).close()
+    assert server.requests[-1].headers['authorization'] == 'Bearer secret'
+    assert server.requests[-1].headers['cookie'] == 'a=1'
+    urequests_ext.get('http://example.com/other', headers=headers,
+                      allow_redirects=True).close()
+    request = server.requests[-1]
+    assert request.headers['host'] == 'example.org'
+    assert request.headers['accept'] == 'text/plain'
+    for name in ('authorization', 'cookie', 'if-none-match'):
+        assert name not in request.headers
+    assert len(headers) == 4
+
+    # Check locations relative to the path and query
+    join = urequests_ext._join_url
+    assert join('http://h/a/b.html?x=1', '?y=2') == 'http://h/a/b.html?y=2'
+    assert join('http://h/a/b.html?x=1', 'c') == 'http://h/a/c'
+    assert join('http://h', '?y=2') == 'http://h/?y=2'
+
+
+def test_upload(server):
+    import uio
+    import ujson
+    from urequests_ext.multipart import MultipartEncoder
+    server.route('/upload', lambda request: response(200, request.body))
+    url = 'http://example.com/upload'
+    body = b''.join([bytes([i % 256]) for i in range(700)])
+
+    class Unseekable:
+        def __init__(self, data):
+            self.f = uio.BytesIO(data)
+
+        def readinto(self, buf):
+            return self.f.readinto(buf)
+
+    def generate():
+        for i in range(0, len(body), 100):
+            yield body[i:i + 100]
+
+    # Check bodies of known size are sent with Content-Length
+    for data in (uio.BytesIO(body), [body[:300], body[300:]]):
+        r = urequests_ext.post(url, data=data)
+        assert r.content == body
+        request = server.requests[-1]
+        assert request.version == 'HTTP/1.0'
+        assert request.headers['content-length'] == '700'
+    f = uio.BytesIO(body)
+    f.read(200)
+    assert urequests_ext.post(url, data=f).content == body[200:]
+
+    # Check other bodies are sent chunked with HTTP/1.1
+    for data in (generate(), Unseekable(body), lambda w: w.write(body)):
+        r = urequests_ext.post(url, data=data)
+        assert r.content == body
+        request = server.requests[-1]
+        assert request.version == 'HTTP/1.1'
+        assert request.headers['transfer-encoding'] == 'chunked'
+        assert request.headers['connection'] == 'close'
+        assert 'content-length' not in request.headers
+        # Check each buffer of data is written as one chunk
+        assert len(server.sockets[-1].writes) < 10
+
+    r = urequests_ext.post(url, data=lambda w: ujson.dump({'a': [1, 2]}, w))
+    assert ujson.loads(r.content) == {'a': [1, 2]}
+
+    # Check containers whose len() isn't a size in bytes are rejected
+    num_requests = len(server.requests)
+    for data in ({'a': 1, 'bb': 2}, {b'a'}):
+        try:
+            urequests_ext.post(url, data=data)
+            assert False
+        except TypeError:
+            pass
+    assert len(server.requests) == num_requests
+
+    # Check streamed bodies don't reuse idle connections and lists do
+    pool = ConnectionPool()
+    urequests_ext.post(url, data=b'x', pool=pool).close()
+    connections = server.connections
+    assert urequests_ext.post(url, data=generate(), pool=pool).content == body
+    assert server.connections == connections + 1
+    assert urequests_ext.post(url, data=[body], pool=pool).content == body
+    assert server.connections == connections + 1
+    pool.close()
+
+    # Check multipart bodies
+    fields = (
+        ('name', 'sensor'),
+        ('log', ('log.txt', uio.BytesIO(body), 'text/plain')),
+        ('raw', ('raw.bin', b'xyz')),
+    )
+    expected = (b'--b1\r\nContent-Disposition: form-data; name="name"\r\n'
+                b'\r\nsensor\r\n'
+                b'--b1\r\nContent-Disposition: form-data; name="log"; '
+                b'filename="log.txt"\r\nContent-Type: text/plain\r\n\r\n' +
+                body + b'\r\n'
+                b'--b1\r\nContent-Disposition: form-data; name="raw"; '
+                b'filename="raw.bin"\r\n\r\nxyz\r\n'
+                b'--b1--\r\n')
+    form = MultipartEncoder(fields, boundary='b1')
+    assert len(form) == len(expected)
+    r = urequests_ext.post(url, data=form)
+    assert r.content == expected
+    request = server.requests[-1]
+    assert request.headers['content-type'] == \
+        'multipart/form-data; boundary=b1'
+    assert request.headers['content-length'] == str(len(expected))
+
+    form = MultipartEncoder((('log', ('log.txt', Unseekable(body))),))
+    try:
+        len(form)
+        assert False
+    except TypeError:
+        pass
+    r = urequests_ext.post(url, data=form,
+                           headers={'Content-Type': 'multipart/mixed'})
+    assert r.content.startswith(b'--' + form.boundary.encode())
+    assert body in r.content
+    request = server.requests[-1]
+    assert request.headers['content-type'] == 'multipart/mixed'
+    assert request.headers['transfer-encoding'] == 'chunked'
+
+
+def test_decompress(server):
+    import ubinascii
+    body = b'hello world\n' * 40
+    # body compressed with a 512 byte window
+    gzipped = ubinascii.a2b_base64(
+        'H4sIAAAAAAACA8tIzcnJVyjPL8pJ4coYZQ87NgB6FQ/G4AEAAA==')
+    deflated = ubinascii.a2b_base64('GNPLSM3JyVcozy/KSeHKGGUPOzYAnNuv8Q==')
+    server.route('/gzip', response(
+        200, gzipped, headers={'Content-Encoding': 'gzip'}))
+    server.route('/deflate', response(
+        200, deflated, headers={'Content-Encoding': 'deflate'}))
+    server.route('/chunked', response(
+        200, chunked(gzipped[:10], gzipped[10:]),
+        headers={'Content-Encoding': 'gzip', 'Transfer-Encoding': 'chunked'}))
+    server.route('/until-close',
+                 b'HTTP/1.0 200 OK\r\nContent-Encoding: gzip\r\n\r\n' +
+                 gzipped)
+    server.route('/hello', response(200, b'Hello'))
+
+    # Check bodies aren't decompressed unless asked for
+    r = urequests_ext.get('http://example.com/gzip')
+    assert 'accept-encoding' not in server.requests[-1].headers
+    assert r.content == gzipped
+
+    wbits = urequests_ext.decompress_wbits
+    urequests_ext.decompress_wbits = 9
+    for path in ('/gzip', '/deflate', '/chunked', '/until-close'):
+        r = urequests_ext.get('http://example.com' + path, decompress=True)
+        assert server.requests[-1].headers['accept-encoding'] == \
+            'gzip, deflate'
+        assert r.content == body
+    r = urequests_ext.get('http://example.com/hello', decompress=True)
+    assert r.text == 'Hello'
+    r = urequests_ext.get('http://example.com/gzip', decompress=True)
+    assert list(r.iter_lines()) == [b'hello world'] * 40
+
+    # Check the connection is reused after reading the whole body
+    pool = ConnectionPool()
+    connections = server.connections
+    for _ in range(2):
+        r = urequests_ext.get('http://example.com/gzip', decompress=True,
+                              pool=pool)
+        buf = bytearray(100)
+        size = 0
+        while True:
+            n = r.readinto(buf)
+            if not n:
+                break
+            size += n
+        r.close()
+        assert size == len(body)
+    assert server.connections == connections + 1
+    pool.close()
+
+    # Check deflate bodies with a larger window than decompress_wbits fail
+    urequests_ext.decompress_wbits = 8
+    try:
+        urequests_ext.get('http://example.com/deflate', decompress=True)
+        assert False
+    except ValueError:
+        pass
+    assert server.sockets[-1].closed
+    urequests_ext.decompress_wbits = wbits
+
+    # Check decompressed bodies larger than the cache aren't cached
+    import uos
+    from urequests_ext.cache import ResponseCache
+    server.route('/gzip-etag', response(
+        200, gzipped, headers={'Content-Encoding': 'gzip', 'ETag': '"g"'}))
+    server.route('/small', response(200, b's' * 40, headers={'ETag': '"s"'}))
+    path = 'test_http_cache'
+    cache = ResponseCache(path, max_size=len(body) - 1)
+    cache.clear()
+    urequests_ext.get('http://example.com/small', cache=cache).close()
+    r = urequests_ext.get('http://example.com/gzip-etag', decompress=True,
+                          cache=cache)
+    assert list(r.iter_lines()) == [b'hello world'] * 40
+    assert len(cache) == 1
+    assert cache.size == 40
+    assert sorted(uos.listdir(path)) == sorted(['index',
+                                                cache._entries[0][0]])
+    r = urequests_ext.get('http://example.com/gzip-etag', decompress=True,
+                          cache=cache)
+    assert r.content == body
+
+    # Check entries are evicted to fit a decompressed body
+    cache.max_size = len(body)
+    r = urequests_ext.get('http://example.com/gzip-etag', decompress=True,
+                          cache=cache)
+    assert r.content == body
+    assert len(cache) == 1
+    assert cache.size == len(body)
+    cache.clear()
+    uos.remove(path + '/index')
+    uos.rmdir(path)
+
+
+def test_cache(server):
+    import uos
+    from urequests_ext.cache import ResponseCache
+
+    def conditional(etag, body):
+        def handle(request):
+            if request.headers.get('if-none-match') == etag:
+                return response(304, reason='Not Modified')
+            return response(200, body, headers={'ETag': etag})
+        return handle
+
+    server.route('/config', conditional('"v1"', b'config 1'))
+    server.route('/a', conditional('"a"', b'a' * 40))
+    server.route('/b', conditional('"b"', b'b' * 40))
+    server.route('/hello', response(200, b'Hello'))
+    path = 'test_http_cache'
+    cache = ResponseCache(path, max_size=100, max_entries=2)
+    cache.clear()
+    url = 'http://example.com/config'
+
+    # Check the first request stores the response
+    r = urequests_ext.get(url, cache=cache)
+    assert r.status_code == 200
+    assert not r.from_cache
+    assert r.text == 'config 1'
+    assert 'if-none-match' not in server.requests[-1].headers
+    assert len(cache) == 1
+
+    # Check the next request is conditional and read from the cache
+    r = urequests_ext.get(url, cache=cache)
+    assert server.requests[-1].headers['if-none-match'] == '"v1"'
+    assert r.status_code == 200
+    assert r.from_cache
+    assert r.headers['etag'] == b'"v1"'
+    assert r.text == 'config 1'
+
+    # Check a changed response replaces the cached one
+    server.route('/config', conditional('"v2"', b'config 2'))
+    assert urequests_ext.get(url, cache=cache).text == 'config 2'
+    r = urequests_ext.get(url, cache=cache)
+    assert r.from_cache
+    assert r.text == 'config 2'
+    assert len(cache) == 1
+
+    # Check responses without validators and other methods aren't cached
+    urequests_ext.get('http://example.com/hello', cache=cache).close()
+    urequests_ext.post(url, data='x', cache=cache).close()
+    assert 'if-none-match' not in server.requests[-1].headers
+    assert len(cache) == 1
+
+    # Check the least recently used entries are removed
+    urequests_ext.get('http://example.com/a', cache=cache).close()
+    urequests_ext.get(url, cache=cache).close()
+    urequests_ext.get('http://example.com/b', cache=cache).close()
+    assert len(cache) == 2
+    assert cache.conditional_headers('http://example.com/a') is None
+    assert cache.size == 48
+
+    # Check the cache is loaded from flash, removing entries not in the
+    # index but not other files
+    for name in ('main.py', '0123456789abcdef'):
+        with open(path + '/' + name, 'w') as f:
+            f.write('x')
+    uos.mkdir(path + '/lib')
+    cache = ResponseCache(path, max_size=100, max_entries=2)
+    assert len(cache) == 2
+    assert cache.response(url).text == 'config 2'
+    names = uos.listdir(path)
+    assert 'main.py' in names and 'lib' in names
+    assert '0123456789abcdef' not in names
+    uos.remove(path + '/main.py')
+    uos.rmdir(path + '/lib')
+
+    # Check the module cache is used
+    urequests_ext.response_cache = cache
+    assert urequests_ext.get(url).from_cache
+    assert not urequests_ext.get(url, cache=False).from_cache
+    urequests_ext.response_cache = None
+
+    cache.clear()
+    assert len(cache) == 0
+    uos.remove(path + '/index')
+    uos.rmdir(path)
+
+
+def test_stats(server):
+    from urequests_ext import stats
+    server.route('/hello', response(200, b'Hello'))
+    server.route('/slow', lambda request: response(200, b'x' * 100))
+
+    r = urequests_ext.get('http://example.com/hello')
+    assert r.stats is None
+    r.close()
+
+    # Check the phases and bytes of a request
+    r = urequests_ext.post('http://example.com/hello', data=b'abc',
+                           stats=True)
+    s = r.stats
+    assert s.end is None
+    assert r.text == 'Hello'
+    assert s.end is not None
+    assert s.method == 'POST'
+    assert s.host == 'example.com'
+    assert s.status_code == 200
+    assert not s.reused
+    assert not s.error
+    assert s.bytes_sent == sum([len(w) for w in server.sockets[-1].writes])
+    assert s.bytes_received == len(response(200, b'Hello'))
+    d = s.durations()
+    assert sorted(d) == ['body', 'connect', 'dns', 'headers', 'send', 'wait']
+    assert sum([d[k] for k in d]) == s.total_us
+
+    # Check pooled connections are reused and counted separately
+    pool = ConnectionPool()
+    collector = stats.StatsCollector(buckets_ms=(100, 1000))
+    urequests_ext.stats_collector = collector
+    for _ in range(3):
+        r = urequests_ext.get('http://example.com/slow', pool=pool)
+        assert len(r.content) == 100
+        assert r.stats.bytes_received == len(response(200, b'x' * 100))
+    assert r.stats.reused
+    assert 'dns' not in r.stats.durations()
+
+    # Check the socket is pooled without the stats wrapper
+    assert not isinstance(pool._idle[-1][1], stats.CountingSocket)
+    bytes_received = r.stats.bytes_received
+    urequests_ext.stats_collector = None
+    for r2 in urequests_ext.pipeline([('GET', 'http://example.com/slow')],
+                                     pool=pool):
+        r2.content
+    assert r.stats.bytes_received == bytes_received
+    urequests_ext.stats_collector = collector
+    urequests_ext.get('http://example.org/hello', pool=False).close()
+    try:
+        urequests_ext.get('ftp://example.org/')
+        assert False
+    except ValueError:
+        pass
+    server.close_all()
+    try:
+        urequests_ext.get('http://example.org/hello', total_timeout=0)
+        assert False
+    except OSError:
+        pass
+    urequests_ext.stats_collector = None
+    pool.close()
+
+    host = collector.hosts['example.com']
+    assert host.count == 3
+    assert host.reused == 2
+    assert host.errors == 0
+    assert host.bytes_received == 3 * len(response(200, b'x' * 100))
+    assert sum(host.histogram) == 3
+    assert len(host.histogram) == 3
+    # dns, connect and tls only happened on the first connection
+    assert host.phase_count == [1, 1, 0, 3, 3, 3, 3]
+    host = collector.hosts['example.org']
+    assert host.count == 2
+    assert host.errors == 1
+    collector.dump()
+    collector.reset()
+    assert not collector.hosts
+
+
+def test_pipeline(server):
+    def echo(request):
+        return response(200, request.body or request.path.encode())
+
+    server.route('/telemetry', echo)
+    server.route('/big', response(200, b'x' * 1000))
+    server.route('/last', response(200, b'last', headers={
+        'Connection': 'close'}))
+    url = 'http://example.com/telemetry'
+    requests = [('POST', url, b'%d' % i,
+                 {'Content-Type': 'text/plain'}) for i in range(5)]
+
+    # Check all requests are sent before the first response is read
+    num_requests = len(server.requests)
+    connections = server.connections
+    responses = urequests_ext.pipeline(requests)
+    r = next(responses)
+    assert len(server.requests) == num_requests + 5
+    assert r.text == '0'
+    assert [r.text for r in responses] == ['1', '2', '3', '4']
+    assert server.connections == connections + 1
+    assert [req.version for req in server.requests[-5:]] == ['HTTP/1.1'] * 5
+    assert server.requests[-1].headers['connection'] == 'close'
+    assert 'connection' not in server.requests[-2].headers
+    assert server.sockets[-1].closed
+
+    # Check unread and partly read bodies are skipped
+    responses = urequests_ext.pipeline([
+        ('GET', 'http://example.com/big'),
+        ('GET', 'http://example.com/big'),
+        ('GET', 'http://example.com/telemetry'),
+    ])
+    next(responses).close()
+    r = next(responses)
+    assert len(r.raw.read(10)) == 10
+    assert next(responses).text == '/telemetry'
+
+    # Check the connection is returned to the pool after the last response
+    pool = ConnectionPool()
+    connections = server.connections
+    for _ in range(2):
+        for r in urequests_ext.pipeline(requests, pool=pool):
+            r.content
+    assert server.connections == connections + 1
+    assert len(pool) == 1
+
+    # Check small unread bodies are skipped to reuse the connection
+    max_drain = pool.max_drain
+    pool.max_drain = 16
+    for path in ('/telemetry', '/big', '/telemetry'):
+        urequests_ext.get('http://example.com' + path, pool=pool).close()
+    assert server.connections == connections + 2
+    pool.max_drain = max_drain
+
+    # Check requests the server didn't answer are sent again
+    server.route('/first', response(200, b'first', headers={
+        'Connection': 'close'}))
+    responses = urequests_ext.pipeline([
+        ('GET', 'http://example.com/first'),
+        ('GET', 'http://example.com/telemetry'),
+        ('GET', 'http://example.com/big'),
+    ], pool=pool)
+    assert [r.content[:5] for r in responses] == \
+        [b'first', b'/tele', b'xxxxx']
+    assert server.connections == connections + 3
+
+    # Check they're sent again if the server closes the connection without
+    # Connection: close
+    num_requests = len(server.requests)
+    responses = urequests_ext.pipeline([
+        ('GET', 'http://example.com/telemetry'),
+        ('GET', 'http://example.com/big'),
+        ('GET', 'http://example.com/telemetry'),
+    ], pool=pool)
+    assert next(responses).text == '/telemetry'
+    server.close_all()
+    assert [r.content[:5] for r in responses] == [b'xxxxx', b'/tele']
+    assert server.connections == connections + 4
+    assert len(server.requests) == num_requests + 5
+    pool.close()
+
+    # Check the connection is closed if the responses aren't all read
+    responses = urequests_ext.pipeline(requests)
+    next(responses)
+    responses.close()
+    assert server.sockets[-1].closed
+
+    try:
+        urequests_ext.pipeline([('GET', 'http://example.com/'),
+                                ('GET', 'http://example.org/')])
+        assert False
+    except ValueError:
+        pass
+
+
+def test_aio(server):
+    import uasyncio
+    from urequests_ext import aio
+    aio._open_connection = server.open_connection
+    server.route('/hello', response(200, b'Hello'))
+    server.route('/chunked', response(
+        200, chunked(b'Hel', b'lo'), headers={'Transfer-Encoding': 'chunked'}))
+    server.route('/until-close', b'HTTP/1.0 200 OK\r\n\r\nUntil close')
+    server.route('/moved', response(302, b'', headers={'Location': '/hello'}))
+
+    async def run():
+        r = await aio.get('http://example.com/hello')
+        assert r.status_code == 200
+        assert r.reason == b'OK'
+        assert r.headers['content-length'] == b'5'
+        assert r.text == 'Hello'
+        assert server.requests[-1].headers['host'] == 'example.com'
+        assert server.sockets[-1].closed
+
+        r = await aio.post('http://example.com/hello', json={'a': 1})
+        r.close()
+        assert server.requests[-1].method == 'POST'
+        assert server.requests[-1].body == b'{"a": 1}'
+
+        assert (await aio.get('http://example.com/chunked')).text == 'Hello'
+        r = await aio.get('http://example.com/until-close')
+        assert r.text == 'Until close'
+        r = await aio.get('http://example.com/moved')
+        assert r.status_code == 302
+        assert r.location == b'/hello'
+        r = await aio.head('http://example.com/hello')
+        assert r.content == b''
+
+        # Check requests overlap up to max_connections
+        server.stream_delay_ms = 5
+        server.max_open_streams = 0
+        rs = await uasyncio.gather(
+            *[aio.get('http://example.com/hello') for _ in range(5)])
+        assert [r.text for r in rs] == ['Hello'] * 5
+        assert server.max_open_streams == aio.max_connections
+        assert server.open_streams == 0
+
+        # Check the timeout and that the connection is closed
+        try:
+            await aio.get('http://example.com/hello', timeout=0.001)
+            assert False
+        except uasyncio.TimeoutError:
+            pass
+        assert server.open_streams == 0
+        assert aio._active == 0
+        server.stream_delay_ms = 0
+
+    uasyncio.run(run())
+
+
+def main():
+    server = StubServer()
+    urequests_ext.usocket = server
+
+    test_request(server)
+    test_headers(server)
+    test_connection_pool(server)
+    test_chunked(server)
+    test_streaming(server)
+    test_json(server)
+    test_dns_cache(server)
+    test_timeouts(server)
+    test_redirects(server)
+    test_upload(server)
+    test_decompress(server)
+    test_cache(server)
+    test_stats(server)
+    test_pipeline(server)
+    test_aio(server)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,502 @@
+import uerrno
 import usocket
+import utime
 
-capture_response_headers = False
+# ConnectionPool used by requests that don't pass a pool. If set, requests
+# use HTTP/1.1 and keep connections open for reuse.
+connection_pool = None
 
+# ResponseCache used by GET requests that don't pass a cache
+response_cache = None
 
-def request(method, url, data=None, json=None, headers={}, stream=None):
+# StatsCollector that the RequestStats of every request are added to
+stats_collector = None
+
+# Window size, 2**decompress_wbits bytes, used to decompress responses
+decompress_wbits = 15
+
+# DNS cache settings. Failed lookups are cached for dns_negative_ttl_ms.
+# Set dns_cache_size to 0 to disable the cache.
+dns_cache_size = 8
+dns_cache_ttl_ms = 300000
+dns_negative_ttl_ms = 5000
+# (host, port) -> (expiry ticks_ms, address or OSError)
+_dns_cache = {}
+
+# Errors writing to or reading from an idle connection the server closed
+_CLOSED_ERRORS = (uerrno.ECONNRESET, uerrno.EPIPE)
+
+
+def resolve(host, port):
+    """Returns the address of host and port from the DNS cache or
+    usocket.getaddrinfo."""
+    key = (host, port)
+    entry = _dns_cache.get(key)
+    now = utime.ticks_ms()
+    if entry is not None:
+        if utime.ticks_diff(entry[0], now) > 0:
+            if isinstance(entry[1], OSError):
+                raise entry[1]
+            return entry[1]
+        del _dns_cache[key]
+    try:
+        addr = usocket.getaddrinfo(host, port)[0][-1]
+        entry = (utime.ticks_add(now, dns_cache_ttl_ms), addr)
+    except OSError as e:
+        addr = None
+        entry = (utime.ticks_add(now, dns_negative_ttl_ms), e)
+    if dns_cache_size > 0:
+        if len(_dns_cache) >= dns_cache_size:
+            # Evict the entry closest to expiring
+            oldest = None
+            for k in _dns_cache:
+                if oldest is None or utime.ticks_diff(
+                        _dns_cache[k][0], _dns_cache[oldest][0]) < 0:
+                    oldest = k
+            del _dns_cache[oldest]
+        _dns_cache[key] = entry
+    if addr is None:
+        raise entry[1]
+    return addr
+
+
+def flush_dns_cache(host=None):
+    """Removes host, or all hosts if not given, from the DNS cache."""
+    if host is None:
+        _dns_cache.clear()
+        return
+    for key in [k for k in _dns_cache if k[0] == host]:
+        del _dns_cache[key]
+
+
+def _connect(proto, host, port, connect_timeout=None, read_timeout=None,
+             stats=None):
+    addr = resolve(host, port)
+    if stats is not None:
+        stats.dns = utime.ticks_us()
+    s = usocket.socket()
+    try:
+        if connect_timeout is not None:
+            s.settimeout(connect_timeout)
+        s.connect(addr)
+        s.settimeout(read_timeout)
+    except OSError:
+        # The cached address may be stale
+        s.close()
+        flush_dns_cache(host)
+        raise
+    if stats is not None:
+        stats.connect = utime.ticks_us()
+    if proto == "https:":
+        import ussl
+        s = ussl.wrap_socket(s, server_hostname=host)
+        if stats is not None:
+            stats.tls = utime.ticks_us()
+    return s
+
+
+# Buffer the request head is assembled in, allocated on first use
+_head_buf = None
+HEAD_BUF_SIZE = 256
+
+
+def _put(s, buf, n, data):
+    """Copies data into buf at n and returns the new end. Writes out buf
+    first if data doesn't fit, and writes data directly if it's larger than
+    buf."""
+    if type(data) is str:
+        data = data.encode()
+    end = n + len(data)
+    if end > len(buf):
+        if n:
+            s.write(memoryview(buf)[:n])
+        if len(data) > len(buf):
+            s.write(data)
+            return 0
+        end = len(data)
+        n = 0
+    buf[n:end] = data
+    return end
+
+
+def _is_buffer(data):
+    return data is None or type(data) in (str, bytes, bytearray) or \
+        isinstance(data, memoryview)
+
+
+def _replayable(data):
+    """Returns True if the body can be sent more than once."""
+    return _is_buffer(data) or callable(data) or type(data) in (list, tuple)
+
+
+def _body_size(data):
+    """Returns the length of a file or iterable request body, None if it's
+    not known. Raises TypeError for dicts and sets, whose len() isn't the
+    size of a body."""
+    if callable(data):
+        return None
+    if type(data) in (dict, set):
+        raise TypeError("Unsupported data type")
+    if hasattr(data, "readinto"):
+        # Files are sent from their current position
+        try:
+            pos = data.tell()
+            size = data.seek(0, 2) - pos
+            data.seek(pos)
+            return size
+        except (AttributeError, OSError):
+            return None
+    if type(data) in (list, tuple):
+        size = 0
+        for part in data:
+            size += len(part.encode() if type(part) is str else part)
+        return size
+    # Other iterables give their size in bytes with len()
+    try:
+        return len(data)
+    except TypeError:
+        return None
+
+
+class _ChunkedWriter:
+    """Writes a request body with chunked transfer encoding. Data is
+    collected in buf and each full buf is written as one chunk, with one
+    write."""
+
+    def __init__(self, s, buf):
+        self._s = s
+        self._buf = buf
+        # Room for the chunk size line before and CRLF after the data
+        self._start = len(b"%x\r\n" % len(buf))
+        self._end = len(buf) - 2
+        self._n = self._start
+
+    def write(self, data):
+        if type(data) is str:
+            data = data.encode()
+        data = memoryview(data)
+        i = 0
+        while i < len(data):
+            m = min(len(data) - i, self._end - self._n)
+            self._buf[self._n:self._n + m] = data[i:i + m]
+            self._n += m
+            i += m
+            if self._n == self._end:
+                self.flush()
+        return i
+
+    def readfrom(self, f):
+        """Writes the rest of file f."""
+        mv = memoryview(self._buf)
+        while True:
+            m = f.readinto(mv[self._n:self._end])
+            if not m:
+                break
+            self._n += m
+            if self._n == self._end:
+                self.flush()
+
+    def flush(self):
+        size = self._n - self._start
+        if not size:
+            return
+        line = b"%x\r\n" % size
+        start = self._start - len(line)
+        buf = self._buf
+        buf[start:self._start] = line
+        buf[self._n:self._n + 2] = b"\r\n"
+        self._s.write(memoryview(buf)[start:self._n + 2])
+        self._n = self._start
+
+    def close(self):
+        self.flush()
+        self._s.write(b"0\r\n\r\n")
+
+
+def _send(s, method, host, path, headers, data, version):
+    """Writes the request. The head and a body that fits in the rest of
+    _head_buf are written with one write. Pass header names and values as
+    bytes to avoid allocating.
+
+    data can also be a file, an iterable of bytes or str, or a function that
+    writes the body to the stream passed to it. These are sent as they're
+    read, with Content-Length if the size is known (a seekable file or an
+    iterable with len()) and otherwise chunked, which needs HTTP/1.1. If data
+    has a content_type attribute it's sent as Content-Type unless headers
+    has one."""
+    global _head_buf
+    buf = _head_buf
+    if buf is None:
+        buf = _head_buf = bytearray(HEAD_BUF_SIZE)
+    if _is_buffer(data):
+        length = len(data) if data else 0
+    else:
+        length = _body_size(data)
+        if length is None and version == "HTTP/1.0":
+            version = "HTTP/1.1"
+            if not "Connection" in headers:
+                headers = dict(headers)
+                headers["Connection"] = "close"
+    n = _put(s, buf, 0, method)
+    n = _put(s, buf, n, b" /")
+    n = _put(s, buf, n, path)
+    n = _put(s, buf, n, b" ")
+    n = _put(s, buf, n, version)
+    if not "Host" in headers:
+        n = _put(s, buf, n, b"\r\nHost: ")
+        n = _put(s, buf, n, host)
+    # Iterate over keys to avoid tuple alloc
+    for k in headers:
+        n = _put(s, buf, n, b"\r\n")
+        n = _put(s, buf, n, k)
+        n = _put(s, buf, n, b": ")
+        n = _put(s, buf, n, headers[k])
+    content_type = getattr(data, "content_type", None)
+    if content_type is not None and not "Content-Type" in headers:
+        n = _put(s, buf, n, b"\r\nContent-Type: ")
+        n = _put(s, buf, n, content_type)
+    if length is None:
+        n = _put(s, buf, n, b"\r\nTransfer-Encoding: chunked")
+    elif length:
+        n = _put(s, buf, n, b"\r\nContent-Length: ")
+        n = _put(s, buf, n, str(length))
+    n = _put(s, buf, n, b"\r\n\r\n")
+
+    if _is_buffer(data):
+        if data and n + len(data) <= len(buf):
+            n = _put(s, buf, n, data)
+            data = None
+        s.write(memoryview(buf)[:n])
+        if data:
+            s.write(data)
+    elif length is None:
+        s.write(memoryview(buf)[:n])
+        w = _ChunkedWriter(s, buf)
+        if callable(data):
+            data(w)
+        elif hasattr(data, "readinto"):
+            w.readfrom(data)
+        else:
+            for part in data:
+                w.write(part)
+        w.close()
+    elif hasattr(data, "readinto"):
+        # Read the file into the rest of buf
+        mv = memoryview(buf)
+        while True:
+            m = data.readinto(mv[n:])
+            if not m:
+                break
+            n += m
+            if n == len(buf):
+                s.write(buf)
+                n = 0
+        if n:
+            s.write(mv[:n])
+    else:
+        for part in data:
+            n = _put(s, buf, n, part)
+        if n:
+            s.write(memoryview(buf)[:n])
+
+
+# Permanent redirects (301 and 308) that were followed,
+# url -> (location, status)
+_permanent_redirects = {}
+PERMANENT_REDIRECTS_SIZE = 8
+# Largest redirect body that is read to reuse the connection
+_DRAIN_MAX = 1024
+
+
+def _join_url(url, location):
+    """Returns the absolute URL of a Location relative to url."""
+    if "://" in location:
+        return location
+    proto, host_path = url.split("//", 1)
+    if location.startswith("//"):
+        return proto + location
+    host_path = host_path.split("/", 1)
+    host = host_path[0]
+    if location.startswith("/"):
+        return proto + "//" + host + location
+    path = host_path[1].split("?", 1)[0] if len(host_path) > 1 else ""
+    if location.startswith("?"):
+        return proto + "//" + host + "/" + path + location
+    return proto + "//" + host + "/" + path[:path.rfind("/") + 1] + location
+
+
+def _drain(resp):
+    """Closes a response after reading its body if it's small (or of unknown
+    length, up to _DRAIN_MAX bytes), so its connection can be returned to
+    the pool."""
+    raw = resp.raw
+    if raw is not None and getattr(raw, "remaining", -1) <= _DRAIN_MAX:
+        try:
+            n = 0
+            while n <= _DRAIN_MAX:
+                data = raw.read(256)
+                if not data:
+                    break
+                n += len(data)
+        except OSError:
+            pass
+    resp.close()
+
+
+# Headers that aren't sent on redirects to another host, lowercase
+_CREDENTIAL_HEADERS = ("authorization", "cookie", "if-none-match",
+                       "if-modified-since")
+
+
+def _is_credential(name):
+    if type(name) is not str:
+        name = bytes(name).decode()
+    return name.lower() in _CREDENTIAL_HEADERS
+
+
+def _strip_credentials(headers):
+    """Returns headers without the _CREDENTIAL_HEADERS."""
+    for k in headers:
+        if _is_credential(k):
+            break
+    else:
+        return headers
+    return {k: headers[k] for k in headers if not _is_credential(k)}
+
+
+def _timeouts(timeout, total_timeout):
+    """Returns the connect and read timeouts and the ticks_ms deadline of a
+    request."""
+    if total_timeout is not None:
+        deadline = utime.ticks_add(utime.ticks_ms(),
+                                   int(total_timeout * 1000))
+    else:
+        deadline = None
+    if type(timeout) is tuple:
+        return timeout[0], timeout[1], deadline
+    return timeout, timeout, deadline
+
+
+def request(method, url, data=None, json=None, headers={}, stream=None,
+            pool=None, timeout=None, total_timeout=None,
+            allow_redirects=False, max_redirects=5, cache=None,
+            decompress=False, stats=False):
+    """data is the body as str or bytes, a file, an iterable of str or bytes
+    (such as a multipart.MultipartEncoder) or a function that writes the
+    body to the stream passed to it, e.g. lambda w: ujson.dump(obj, w) to
+    stream a large JSON document. Files and iterables are sent as they're
+    read, chunked if their size isn't known. Only lists and tuples can be
+    sent twice, so other iterables and files don't use idle pooled
+    connections and redirects that would send them again aren't followed.
+
+    pool is a ConnectionPool to use for HTTP/1.1 keep-alive requests,
+    False to not use connection_pool.
+
+    timeout is the connect and read timeout in seconds, or a tuple of
+    (connect timeout, read timeout). The read timeout applies to each read
+    from the socket. total_timeout is the time in seconds for the whole
+    request, including reading the body, after which reads raise
+    OSError(ETIMEDOUT). It's checked between reads so the request can take
+    up to a read timeout longer.
+
+    If allow_redirects is True, redirects are followed up to max_redirects
+    times and the final response is returned. Otherwise a RedirectResponse
+    is returned. Permanent redirects are remembered and followed without a
+    request next time. With a pool, connections are reused for redirects to
+    the same host. Authorization, Cookie, If-None-Match and
+    If-Modified-Since headers aren't sent to another host or protocol.
+
+    cache is a ResponseCache for GET requests, False to not use
+    response_cache. Cached responses are revalidated with a conditional
+    request and read from the cache if the server answers 304.
+
+    If decompress is True, Accept-Encoding: gzip, deflate is sent and
+    compressed bodies are decompressed as they're read, with a window of
+    2**decompress_wbits bytes. The server must not compress with a larger
+    window; for deflate bodies this is checked and ValueError raised.
+
+    If stats is True or stats_collector is set, the response has a stats
+    attribute with the RequestStats of the request: the time of each phase,
+    bytes sent and received and whether the connection was reused. They're
+    added to stats_collector when the response is closed.
+    """
+    connect_timeout, read_timeout, deadline = _timeouts(timeout,
+                                                        total_timeout)
+    if pool is None:
+        pool = connection_pool
+    elif pool is False:
+        pool = None
+    if cache is None:
+        cache = response_cache
+    elif cache is False:
+        cache = None
+    if method != "GET":
+        cache = None
+    if decompress:
+        wbits = decompress_wbits
+        if not "Accept-Encoding" in headers:
+            headers = dict(headers)
+            headers["Accept-Encoding"] = "gzip, deflate"
+    else:
+        wbits = None
+
+    if json is not None:
+        assert data is None
+        import ujson
+        data = ujson.dumps(json)
+    elif not _is_buffer(data):
+        # Check the type before connecting
+        _body_size(data)
+
+    if not allow_redirects:
+        return _request(method, url, data, headers, pool, connect_timeout,
+                        read_timeout, deadline, cache, wbits, stats)
+
+    visited = []
+    while True:
+        entry = _permanent_redirects.get(url)
+        if entry is None:
+            resp = _request(method, url, data, headers, pool,
+                            connect_timeout, read_timeout, deadline, cache,
+                            wbits, stats)
+            status = resp.status_code
+            # Only RedirectResponse has a location
+            location = getattr(resp, "location", None)
+            if status not in (301, 302, 303, 307, 308) or location is None:
+                return resp
+            location = _join_url(url, location.decode())
+        else:
+            # Nothing has been sent yet
+            location, status = entry
+            resp = None
+        # Browsers change POST to GET for 301 and 302, and 303 requires GET
+        to_get = status == 303 or (status in (301, 302) and method == "POST")
+        if resp is not None:
+            if not to_get and not _replayable(data):
+                # The body has been read and can't be sent again
+                return resp
+            _drain(resp)
+            if status in (301, 308):
+                if len(_permanent_redirects) >= PERMANENT_REDIRECTS_SIZE:
+                    del _permanent_redirects[next(iter(_permanent_redirects))]
+                _permanent_redirects[url] = (location, status)
+        # A POST may redirect to a GET of the same URL
+        visited.append((method, url))
+        if to_get:
+            method = "GET"
+            data = None
+        if _parse_url(url)[:3] != _parse_url(location)[:3]:
+            headers = _strip_credentials(headers)
+        if (method, location) in visited:
+            raise ValueError("Redirect loop: " + location)
+        if len(visited) > max_redirects:
+            raise ValueError("Too many redirects")
+        url = location
+
+
+def _parse_url(url):
+    """Returns the protocol, host, port and path (without the leading /) of
+    a URL."""
     try:
         proto, dummy, host, path = url.split("/", 3)
     except ValueError:
@@ -12,7 +505,6 @@ def request(method, url, data=None, json=None, headers={}, stream=None):
     if proto == "http:":
         port = 80
     elif proto == "https:":
-        import ussl
         port = 443
     else:
         raise ValueError("Unsupported protocol: " + proto)
@@ -20,67 +512,335 @@ def request(method, url, data=None, json=None, headers={}, stream=None):
     if ":" in host:
         host, port = host.split(":", 1)
         port = int(port)
+    return proto, host, port, path
 
-    ai = usocket.getaddrinfo(host, port)
-    addr = ai[0][-1]
-    s = usocket.socket()
-    s.connect(addr)
-    if proto == "https:":
-        s = ussl.wrap_socket(s, server_hostname=host)
-    s.write(b"%s /%s HTTP/1.0\r\n" % (method, path))
-    if not "Host" in headers:
-        s.write(b"Host: %s\r\n" % host)
-    # Iterate over keys to avoid tuple alloc
-    for k in headers:
-        s.write(k)
-        s.write(b": ")
-        s.write(headers[k])
-        s.write(b"\r\n")
-    if json is not None:
-        assert data is None
-        import ujson
-        data = ujson.dumps(json)
-    if data:
-        s.write(b"Content-Length: %d\r\n" % len(data))
-    s.write(b"\r\n")
-    if data:
-        s.write(data)
 
-    l = s.readline()
+def _request(method, url, data, headers, pool, connect_timeout,
+             read_timeout, deadline, cache=None, wbits=None, stats=False):
+    """Makes one request and reads the response headers, revalidating a
+    cached response if cache is given. If wbits is given compressed
+    bodies are decompressed with a 2**wbits window. If stats is True the
+    response has RequestStats."""
+    if cache is not None:
+        cond = cache.conditional_headers(url)
+        if cond:
+            cond.update(headers)
+            resp = _request(method, url, data, cond, pool, connect_timeout,
+                            read_timeout, deadline, None, wbits, stats)
+            if resp.status_code == 304:
+                _drain(resp)
+                cached = cache.response(url)
+                if cached is not None:
+                    cached.from_cache = True
+                    cached.stats = resp.stats
+                    return cached
+                resp = None
+        else:
+            resp = None
+        if resp is None:
+            resp = _request(method, url, data, headers, pool,
+                            connect_timeout, read_timeout, deadline, None,
+                            wbits, stats)
+        if resp.status_code == 200:
+            cached = cache.store(url, resp)
+            cached.stats = resp.stats
+            return cached
+        return resp
+
+    proto, host, port, path = _parse_url(url)
+    if stats or stats_collector is not None:
+        from .stats import RequestStats
+        stats = RequestStats(method, host, stats_collector)
+    else:
+        stats = None
+    try:
+        return _request_once(method, proto, host, port, path, data, headers,
+                             pool, connect_timeout, read_timeout, deadline,
+                             wbits, stats)
+    except Exception:
+        if stats is not None:
+            stats.finish(True)
+        raise
+
+
+def _request_once(method, proto, host, port, path, data, headers, pool,
+                  connect_timeout, read_timeout, deadline, wbits, stats):
+    """Sends the request on a pooled or new connection and reads the
+    response headers."""
+    if pool is not None:
+        version = "HTTP/1.1"
+        pool_key = (proto, host, port)
+        # The request is resent if an idle connection was closed, so only
+        # use one if the body can be read again
+        s = pool.get(pool_key) if _replayable(data) else None
+    else:
+        version = "HTTP/1.0"
+        pool_key = None
+        s = None
+    if s is not None:
+        if stats is not None:
+            from .stats import CountingSocket
+            s = CountingSocket(s, stats)
+            stats.reused = True
+        # The server may have closed the idle connection, in which case
+        # retry once with a new connection. Other errors, e.g. a timeout,
+        # may come after the server handled the request, so aren't retried.
+        try:
+            if hasattr(s, "settimeout"):
+                s.settimeout(read_timeout)
+            _send(s, method, host, path, headers, data, version)
+            if stats is not None:
+                stats.sent = utime.ticks_us()
+            l = s.readline()
+        except OSError as e:
+            if e.args[0] not in _CLOSED_ERRORS:
+                s.close()
+                raise
+            l = None
+        if not l:
+            s.close()
+            s = None
+    if s is None:
+        s = _connect(proto, host, port, connect_timeout, read_timeout, stats)
+        if stats is not None:
+            from .stats import CountingSocket
+            s = CountingSocket(s, stats)
+            stats.reused = False
+        try:
+            from .streams import check_deadline
+            check_deadline(deadline)
+            _send(s, method, host, path, headers, data, version)
+            if stats is not None:
+                stats.sent = utime.ticks_us()
+            l = s.readline()
+        except Exception:
+            s.close()
+            raise
+    if stats is not None:
+        stats.first_byte = utime.ticks_us()
+
+    try:
+        return _read_response(s, l, method, pool, pool_key, deadline,
+                              wbits, stats)
+    except Exception:
+        s.close()
+        raise
+
+
+def _parse_status(l):
+    """Returns the protocol version, status code and reason of a status
+    line."""
+    if not l:
+        raise OSError("Connection closed without a response")
     protover, status, msg = l.split(None, 2)
-    status = int(status)
-    #print(protover, status, msg)
-    if capture_response_headers:
-        raw_response_headers = []
+    return protover, int(status), msg.rstrip()
+
+
+def _body_length(method, status, headers):
+    """Returns the length of a response body, None if it's read until the
+    connection is closed or -1 if it's chunked."""
+    # A response to HEAD or with status 1xx, 204 or 304 has no body
+    if method == "HEAD" or status < 200 or status in (204, 304):
+        return 0
+    # Content-Length is ignored if the body is chunked
+    encoding = headers.get(b"transfer-encoding")
+    if encoding is not None and b"chunked" in encoding.lower():
+        return -1
+    length = headers.get(b"content-length")
+    if length is not None:
+        return int(length)
+    return None
+
+
+def _keep_alive(protover, headers):
+    if protover != b"HTTP/1.1":
+        return False
+    connection = headers.get(b"connection")
+    return connection is None or b"close" not in connection.lower()
+
+
+def _make_response(raw, status, reason, headers):
+    from .responses import Response, RedirectResponse
+    if 300 <= status <= 399 and b"location" in headers:
+        resp = RedirectResponse(raw, headers)
+    else:
+        resp = Response(raw, headers)
+    resp.status_code = status
+    resp.reason = reason
+    return resp
+
+
+def _read_response(s, l, method, pool=None, pool_key=None, deadline=None,
+                   wbits=None, stats=None):
+    """Reads the headers of a response after its status line l and returns
+    the Response. If pool is given, the socket is returned to it once the
+    body has been read. Reads after the ticks_ms deadline raise
+    OSError(ETIMEDOUT). If wbits is given, gzip and deflate bodies are
+    decompressed with a 2**wbits window. stats is the RequestStats of the
+    request, if any."""
+    from .responses import Headers
+    from .streams import check_deadline
+    protover, status, reason = _parse_status(l)
+    #print(protover, status, reason)
+    headers = Headers()
     while True:
+        check_deadline(deadline)
         l = s.readline()
         if not l or l == b"\r\n":
             break
         #print(l)
-        if l.startswith(b"Transfer-Encoding:"):
-            if b"chunked" in l:
-                raise ValueError("Unsupported " + l)
-        elif l.startswith(b"Location:") and 300 <= status <= 399:
-            from .responses import RedirectResponse
-            resp = RedirectResponse(s, l)
-            resp.status_code = status
-            resp.reason = msg.rstrip()
-            return resp
-
-        if capture_response_headers:
-            raw_response_headers.append(l)
-
-    if capture_response_headers:
-        from .responses import ResponseWithHeaders
-        resp = ResponseWithHeaders(s, raw_response_headers)
+        headers.add(l)
+    if stats is not None:
+        stats.headers = utime.ticks_us()
+        stats.status_code = status
+
+    if pool is not None and not _keep_alive(protover, headers):
+        pool = None
+    length = _body_length(method, status, headers)
+    if length == -1:
+        from .streams import ChunkedReader
+        s = ChunkedReader(s, pool, pool_key, deadline)
     else:
-        from .responses import Response
-        resp = Response(s)
-    resp.status_code = status
-    resp.reason = msg.rstrip()
+        from .streams import LengthReader
+        s = LengthReader(s, length, pool, pool_key, deadline)
+    if wbits is not None and length != 0:
+        encoding = headers.get(b"content-encoding")
+        if encoding is not None:
+            encoding = encoding.lower()
+            if encoding in (b"gzip", b"x-gzip", b"deflate"):
+                from .streams import DecompressReader
+                s = DecompressReader(s, encoding != b"deflate", wbits)
+    resp = _make_response(s, status, reason, headers)
+    resp.stats = stats
     return resp
 
 
+class _Pipeline:
+    """Pool of the responses of a pipeline except the last, which hand the
+    socket back once their body has been read."""
+    # Read the rest of a body if the response is closed before the end
+    max_drain = -1
+
+    def __init__(self):
+        self.sock = None
+
+    def put(self, key, s):
+        self.sock = s
+
+
+def pipeline(requests, pool=None, timeout=None, total_timeout=None):
+    """Sends requests to one host one after the other over one HTTP/1.1
+    connection without waiting for the responses, and returns an iterator
+    of the responses in the same order.
+
+    requests is a sequence of (method, url), (method, url, data) or
+    (method, url, data, headers) tuples, with data as str or bytes. Each
+    response is read when the iterator is advanced, after reading the rest
+    of the body of the previous one. If the server closes the connection
+    after answering some of the requests, with Connection: close or without
+    a response to the next one, the rest are sent again on a new
+    connection. pool, timeout and total_timeout are as for request(), the
+    connection is returned to the pool after the last response is closed.
+    """
+    connect_timeout, read_timeout, deadline = _timeouts(timeout,
+                                                        total_timeout)
+    if pool is None:
+        pool = connection_pool
+    elif pool is False:
+        pool = None
+    key = None
+    paths = []
+    for r in requests:
+        proto, host, port, path = _parse_url(r[1])
+        if key is None:
+            key = (proto, host, port)
+        elif key != (proto, host, port):
+            raise ValueError("Pipelined requests must be to one host")
+        paths.append(path)
+    return _pipeline(requests, paths, key, pool, connect_timeout,
+                     read_timeout, deadline)
+
+
+def _send_pipelined(s, requests, paths, start, host, close):
+    """Writes requests from index start. If close is True the last asks
+    the server to close the connection."""
+    for i in range(start, len(requests)):
+        r = requests[i]
+        data = r[2] if len(r) > 2 else None
+        headers = r[3] if len(r) > 3 else {}
+        if close and i == len(requests) - 1 and not "Connection" in headers:
+            headers = dict(headers)
+            headers["Connection"] = "close"
+        _send(s, r[0], host, paths[i], headers, data, "HTTP/1.1")
+
+
+def _pipeline(requests, paths, key, pool, connect_timeout, read_timeout,
+              deadline):
+    from .streams import check_deadline
+    proto, host, port = key
+    pipe = _Pipeline()
+    s = None
+    i = 0
+    try:
+        while i < len(requests):
+            if s is None:
+                # Send the requests that haven't been answered
+                s = pool.get(key) if pool is not None else None
+                if s is not None:
+                    # Retry once with a new connection if the idle one
+                    # was closed
+                    try:
+                        if hasattr(s, "settimeout"):
+                            s.settimeout(read_timeout)
+                        _send_pipelined(s, requests, paths, i, host,
+                                        pool is None)
+                        l = s.readline()
+                    except OSError as e:
+                        if e.args[0] not in _CLOSED_ERRORS:
+                            raise
+                        l = None
+                    if not l:
+                        s.close()
+                        s = None
+                if s is None:
+                    s = _connect(proto, host, port, connect_timeout,
+                                 read_timeout)
+                    check_deadline(deadline)
+                    _send_pipelined(s, requests, paths, i, host,
+                                    pool is None)
+                    l = s.readline()
+            else:
+                check_deadline(deadline)
+                try:
+                    l = s.readline()
+                except OSError as e:
+                    if e.args[0] not in _CLOSED_ERRORS:
+                        raise
+                    l = None
+                if not l:
+                    # The server closed the connection after answering the
+                    # previous request, send the rest again
+                    s.close()
+                    s = None
+                    continue
+            last = i == len(requests) - 1
+            resp = _read_response(s, l, requests[i][0],
+                                  pool if last else pipe, key, deadline)
+            i += 1
+            if last:
+                # The response owns the socket now
+                s = None
+            yield resp
+            if not last:
+                resp.close()
+                # None if the server closed the connection
+                s = pipe.sock
+                pipe.sock = None
+    finally:
+        if s is not None:
+            s.close()
+
+
 def head(url, **kw):
     return request("HEAD", url, **kw)
 
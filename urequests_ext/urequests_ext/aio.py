@@ -0,0 +1,133 @@
+"""HTTP client for uasyncio. Requests run on uasyncio streams so other tasks
+keep running while waiting for the network:
+
+    r = await aio.get('http://example.com/')
+    print(r.status_code, r.text)
+
+Responses are the same as from urequests_ext.request, with the body
+already read. At most max_connections requests are open at a time, others
+wait for one to finish.
+"""
+
+import uasyncio
+import uio
+from . import _parse_url, _send, _parse_status, _body_length, _make_response
+
+# Number of requests that can be open at the same time
+max_connections = 2
+
+# Number of open requests and the Event set when one finishes
+_active = 0
+_released = None
+
+# Coroutine that opens a (reader, writer) pair, replaceable for testing
+_open_connection = uasyncio.open_connection
+
+
+async def _acquire():
+    global _active, _released
+    while _active >= max_connections:
+        if _released is None:
+            _released = uasyncio.Event()
+        await _released.wait()
+    _active += 1
+
+
+def _release():
+    global _active, _released
+    _active -= 1
+    if _released is not None:
+        # Wake up all waiting requests, the first to run takes the slot
+        _released.set()
+        _released = None
+
+
+async def _read_chunked(reader):
+    chunks = []
+    while True:
+        l = await reader.readline()
+        if not l:
+            raise ValueError("Truncated chunked body")
+        size = int(l.split(b";", 1)[0], 16)
+        if not size:
+            break
+        chunks.append(await reader.readexactly(size))
+        await reader.readline()
+    # Skip trailers
+    while True:
+        l = await reader.readline()
+        if not l or l == b"\r\n":
+            break
+    return b"".join(chunks)
+
+
+async def _request(method, url, data, headers):
+    from .responses import Headers
+    proto, host, port, path = _parse_url(url)
+    await _acquire()
+    writer = None
+    try:
+        if proto == "https:":
+            reader, writer = await _open_connection(host, port, ssl=True)
+        else:
+            reader, writer = await _open_connection(host, port)
+        _send(writer, method, host, path, headers, data, "HTTP/1.0")
+        await writer.drain()
+
+        protover, status, reason = _parse_status(await reader.readline())
+        resp_headers = Headers()
+        while True:
+            l = await reader.readline()
+            if not l or l == b"\r\n":
+                break
+            resp_headers.add(l)
+
+        length = _body_length(method, status, resp_headers)
+        if length == -1:
+            body = await _read_chunked(reader)
+        elif length is None:
+            body = await reader.read(-1)
+        elif length:
+            body = await reader.readexactly(length)
+        else:
+            body = b""
+    finally:
+        if writer is not None:
+            writer.close()
+            await writer.wait_closed()
+        _release()
+    return _make_response(uio.BytesIO(body), status, reason, resp_headers)
+
+
+async def request(method, url, data=None, json=None, headers={},
+                  timeout=None):
+    """Makes a request and returns the Response after reading the whole
+    body. timeout is the time in seconds for the whole request, after which
+    uasyncio.TimeoutError is raised."""
+    if json is not None:
+        assert data is None
+        import ujson
+        data = ujson.dumps(json)
+    coro = _request(method, url, data, headers)
+    if timeout is not None:
+        return await uasyncio.wait_for(coro, timeout)
+    return await coro
+
+
+async def head(url, **kw):
+    return await request("HEAD", url, **kw)
+
+async def get(url, **kw):
+    return await request("GET", url, **kw)
+
+async def post(url, **kw):
+    return await request("POST", url, **kw)
+
+async def put(url, **kw):
+    return await request("PUT", url, **kw)
+
+async def patch(url, **kw):
+    return await request("PATCH", url, **kw)
+
+async def delete(url, **kw):
+    return await request("DELETE", url, **kw)
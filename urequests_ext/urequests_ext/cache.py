@@ -0,0 +1,290 @@
+import uio
+import uos
+
+# Headers kept with a cached body
+_KEEP_HEADERS = (b"content-encoding", b"content-type", b"etag",
+                 b"last-modified")
+
+
+def _name(url):
+    import uhashlib
+    import ubinascii
+    digest = uhashlib.sha256(url.encode()).digest()
+    return ubinascii.hexlify(digest[:8]).decode()
+
+
+def _is_name(name):
+    """Returns True if name could be from _name()."""
+    if len(name) != 16:
+        return False
+    for c in name:
+        if c not in "0123456789abcdef":
+            return False
+    return True
+
+
+class _SpillReader(uio.IOBase):
+    """Reads the start of a body from the file f it was written to, then
+    the rest from raw. The file at path is removed when it's read or the
+    reader is closed."""
+
+    def __init__(self, f, path, raw):
+        self._f = f
+        self._path = path
+        self._raw = raw
+
+    def _next(self):
+        self._f.close()
+        self._f = None
+        uos.remove(self._path)
+
+    def read(self, n=-1):
+        if self._f is not None:
+            data = self._f.read() if n < 0 else self._f.read(n)
+            if n < 0:
+                self._next()
+                return data + self._raw.read()
+            if data:
+                return data
+            self._next()
+        return self._raw.read() if n < 0 else self._raw.read(n)
+
+    def readinto(self, buf, n=-1):
+        if 0 <= n < len(buf):
+            buf = memoryview(buf)[:n]
+        if self._f is not None:
+            n = self._f.readinto(buf)
+            if n:
+                return n
+            self._next()
+        return self._raw.readinto(buf)
+
+    def readline(self):
+        l = b""
+        if self._f is not None:
+            l = self._f.readline()
+            if l.endswith(b"\n"):
+                return l
+            self._next()
+        return l + self._raw.readline()
+
+    def close(self):
+        if self._f is not None:
+            self._next()
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
+
+
+class ResponseCache:
+    """Cache of GET responses on flash for conditional requests.
+
+    Responses with an ETag or Last-Modified header are stored in the
+    directory path, and later requests for the same URL send If-None-Match
+    or If-Modified-Since. If the server answers 304 Not Modified the body is
+    read from the cache. Set urequests_ext.response_cache or pass cache= to
+    request() to use it.
+
+    At most max_entries responses and max_size bytes of bodies are kept, the
+    least recently used are removed first. Responses without Content-Length,
+    larger than max_size or with Cache-Control: no-store aren't cached.
+    Bodies are stored as they're read from the response, so decompressed
+    if the request decompresses them. A decompressed body that turns out
+    larger than max_size isn't cached.
+    Reads of cached responses are saved to flash with the next store, to
+    avoid writing on every hit.
+    """
+
+    def __init__(self, path="/http_cache", max_size=32768, max_entries=16):
+        self.path = path
+        self.max_size = max_size
+        self.max_entries = max_entries
+        # List of [name, size] of the entries, least recently used first
+        self._entries = []
+        self.size = 0
+        try:
+            uos.mkdir(path)
+        except OSError:
+            pass
+        try:
+            with open(path + "/index") as f:
+                for l in f:
+                    name, size = l.split()
+                    self._entries.append([name, int(size)])
+                    self.size += int(size)
+        except (OSError, ValueError):
+            pass
+        # Remove entries not in the index, e.g. after a failed store. Other
+        # files are left alone as path may be shared.
+        names = [e[0] for e in self._entries]
+        for name in uos.listdir(path):
+            if _is_name(name) and name not in names:
+                try:
+                    uos.remove(path + "/" + name)
+                except OSError:
+                    pass
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _find(self, name):
+        for i in range(len(self._entries)):
+            if self._entries[i][0] == name:
+                return i
+        return -1
+
+    def _save_index(self):
+        with open(self.path + "/index", "w") as f:
+            for name, size in self._entries:
+                f.write("%s %d\n" % (name, size))
+
+    def _remove(self, i):
+        name, size = self._entries.pop(i)
+        self.size -= size
+        try:
+            uos.remove(self.path + "/" + name)
+        except OSError:
+            pass
+
+    def _open(self, url):
+        """Returns the file of the entry for url positioned at its headers,
+        or None."""
+        name = _name(url)
+        if self._find(name) < 0:
+            return None
+        try:
+            f = open(self.path + "/" + name, "rb")
+        except OSError:
+            return None
+        if f.readline().rstrip().decode() != url:
+            f.close()
+            return None
+        return f
+
+    def _read_headers(self, f):
+        from .responses import Headers
+        headers = Headers()
+        while True:
+            l = f.readline()
+            if not l or l == b"\r\n":
+                break
+            headers.add(l)
+        return headers
+
+    def conditional_headers(self, url):
+        """Returns the If-None-Match and If-Modified-Since headers for a
+        request for url, or None if it's not cached."""
+        f = self._open(url)
+        if f is None:
+            return None
+        try:
+            headers = self._read_headers(f)
+        finally:
+            f.close()
+        cond = {}
+        value = headers.get(b"etag")
+        if value is not None:
+            cond["If-None-Match"] = value
+        value = headers.get(b"last-modified")
+        if value is not None:
+            cond["If-Modified-Since"] = value
+        return cond
+
+    def response(self, url):
+        """Returns a Response with the cached body of url, or None if it's
+        not cached."""
+        from .responses import Response
+        f = self._open(url)
+        if f is None:
+            return None
+        resp = Response(f, self._read_headers(f))
+        resp.status_code = 200
+        resp.reason = b"OK"
+        i = self._find(_name(url))
+        self._entries.append(self._entries.pop(i))
+        return resp
+
+    def store(self, url, resp):
+        """Stores the body of resp if it can be cached and returns a Response
+        reading it from the cache. Otherwise returns resp."""
+        headers = resp.headers
+        length = headers.get(b"content-length")
+        if length is None or int(length) > self.max_size:
+            return resp
+        if b"etag" not in headers and b"last-modified" not in headers:
+            return resp
+        control = headers.get(b"cache-control")
+        if control is not None and b"no-store" in control.lower():
+            return resp
+
+        name = _name(url)
+        i = self._find(name)
+        if i >= 0:
+            self._remove(i)
+        length = int(length)
+        from .streams import DecompressReader
+        decompressed = isinstance(resp.raw, DecompressReader)
+        while self._entries and (len(self._entries) >= self.max_entries or
+                                 self.size + length > self.max_size):
+            self._remove(0)
+        path = self.path + "/" + name
+        try:
+            with open(path, "wb") as f:
+                f.write(url.encode())
+                f.write(b"\n")
+                for k in _KEEP_HEADERS:
+                    value = headers.get(k)
+                    if value is not None and not (
+                            decompressed and k == b"content-encoding"):
+                        f.write(k)
+                        f.write(b": ")
+                        f.write(value)
+                        f.write(b"\r\n")
+                f.write(b"\r\n")
+                size = 0
+                buf = bytearray(256)
+                mv = memoryview(buf)
+                while size <= self.max_size:
+                    n = resp.readinto(buf)
+                    if not n:
+                        break
+                    f.write(mv[:n])
+                    size += n
+        except Exception:
+            resp.close()
+            uos.remove(path)
+            self._save_index()
+            raise
+        if size > self.max_size:
+            # Read the part written so far back from the file
+            self._save_index()
+            f = open(path, "rb")
+            f.readline()
+            self._read_headers(f)
+            resp.raw = _SpillReader(f, path, resp.raw)
+            return resp
+        resp.close()
+        if size != length and not decompressed:
+            uos.remove(path)
+            self._save_index()
+            raise ValueError("Truncated response")
+        # A decompressed body can be larger than the Content-Length
+        while self._entries and self.size + size > self.max_size:
+            self._remove(0)
+        self._entries.append([name, size])
+        self.size += size
+        self._save_index()
+        return self.response(url)
+
+    def remove(self, url):
+        """Removes url from the cache."""
+        i = self._find(_name(url))
+        if i >= 0:
+            self._remove(i)
+            self._save_index()
+
+    def clear(self):
+        """Removes all entries."""
+        while self._entries:
+            self._remove(0)
+        self._save_index()
@@ -0,0 +1,162 @@
+"""Incremental JSON reader for picking values out of large JSON documents
+without building the whole object tree.
+
+    r = urequests_ext.get(url)
+    values = jsonstream.select(r.raw, ('name', 'main.temp', 'weather.0.id'))
+    r.close()
+"""
+
+START_MAP = "start_map"
+END_MAP = "end_map"
+START_ARRAY = "start_array"
+END_ARRAY = "end_array"
+KEY = "key"
+VALUE = "value"
+
+_ESCAPES = {
+    ord("b"): 0x08, ord("f"): 0x0c, ord("n"): 0x0a, ord("r"): 0x0d,
+    ord("t"): 0x09,
+}
+
+
+class _Reader:
+    def __init__(self, stream, buf_size):
+        self._stream = stream
+        self._buf = bytearray(buf_size)
+        self._len = 0
+        self._pos = 0
+
+    def peek(self):
+        """Returns the next byte without consuming it, -1 at the end."""
+        if self._pos == self._len:
+            self._len = self._stream.readinto(self._buf) or 0
+            self._pos = 0
+            if not self._len:
+                return -1
+        return self._buf[self._pos]
+
+    def next(self):
+        c = self.peek()
+        self._pos += 1
+        return c
+
+    def next_token(self):
+        """Returns the next byte that's not whitespace, -1 at the end."""
+        while True:
+            c = self.next()
+            if c not in (0x20, 0x0a, 0x0d, 0x09):
+                return c
+
+    def string(self):
+        out = bytearray()
+        while True:
+            c = self.next()
+            if c == 0x22:  # "
+                return out.decode()
+            if c < 0:
+                raise ValueError("Truncated JSON string")
+            if c == 0x5c:  # backslash
+                c = self.next()
+                if c == 0x75:  # u
+                    code = 0
+                    for _ in range(4):
+                        code = (code << 4) | int(chr(self.next()), 16)
+                    out.extend(chr(code).encode())
+                    continue
+                c = _ESCAPES.get(c, c)
+            out.append(c)
+
+    def literal(self, c):
+        out = bytearray((c,))
+        while True:
+            c = self.peek()
+            if c < 0 or c in b",:]} \t\r\n":
+                break
+            out.append(self.next())
+        if out == b"true":
+            return True
+        if out == b"false":
+            return False
+        if out == b"null":
+            return None
+        out = out.decode()
+        if "." in out or "e" in out or "E" in out:
+            return float(out)
+        return int(out)
+
+
+def events(stream, buf_size=64):
+    """Yields (event, value) tuples for a JSON document read from stream.
+
+    Events are START_MAP, END_MAP, START_ARRAY, END_ARRAY (value is None),
+    KEY (value is the key) and VALUE (value is a string, number, boolean or
+    None). stream only needs a readinto method and is read buf_size bytes
+    at a time. ValueError is raised if the document is truncated.
+    """
+    r = _Reader(stream, buf_size)
+    # True for maps and False for arrays that haven't ended
+    stack = []
+    expect_key = False
+    while True:
+        c = r.next_token()
+        if c < 0:
+            if stack:
+                raise ValueError("Truncated JSON document")
+            return
+        if c == 0x7b:  # {
+            stack.append(True)
+            expect_key = True
+            yield START_MAP, None
+        elif c == 0x7d:  # }
+            stack.pop()
+            expect_key = False
+            yield END_MAP, None
+        elif c == 0x5b:  # [
+            stack.append(False)
+            expect_key = False
+            yield START_ARRAY, None
+        elif c == 0x5d:  # ]
+            stack.pop()
+            yield END_ARRAY, None
+        elif c == 0x2c:  # ,
+            expect_key = stack[-1]
+        elif c == 0x3a:  # :
+            expect_key = False
+        elif c == 0x22:  # "
+            yield KEY if expect_key else VALUE, r.string()
+            expect_key = False
+        else:
+            yield VALUE, r.literal(c)
+        if not stack:
+            return
+
+
+def select(stream, paths, buf_size=64):
+    """Reads a JSON document from stream and returns a dict of the values at
+    paths. A path is the keys and array indexes to a value separated by dots,
+    e.g. "results.0.name". Only strings, numbers, booleans and null can be
+    selected. Paths that aren't found are not in the returned dict.
+    """
+    wanted = set(paths)
+    found = {}
+    # Key or index at each level of the document
+    path = []
+    for event, value in events(stream, buf_size):
+        if event == KEY:
+            path[-1] = value
+            continue
+        if path and isinstance(path[-1], int):
+            path[-1] += 1
+        if event == START_MAP:
+            path.append(None)
+        elif event == START_ARRAY:
+            path.append(-1)
+        elif event == END_MAP or event == END_ARRAY:
+            path.pop()
+        else:
+            key = ".".join([str(k) for k in path])
+            if key in wanted:
+                found[key] = value
+                if len(found) == len(wanted):
+                    break
+    return found
@@ -0,0 +1,78 @@
+"""Streaming multipart/form-data encoder, for uploading files without
+reading them into memory:
+
+    with open('log.txt', 'rb') as f:
+        form = MultipartEncoder((('device', 'abc'),
+                                 ('log', ('log.txt', f, 'text/plain'))))
+        r = urequests_ext.post(url, data=form)
+"""
+
+
+class MultipartEncoder:
+    """Encodes fields as multipart/form-data as it's iterated. fields is a
+    sequence of (name, value), where value is str or bytes, or a tuple of
+    (filename, data) or (filename, data, content type) for a file. data is
+    bytes or a file, which is read chunk_size bytes at a time.
+
+    Pass it as data to request(), which sends content_type as the
+    Content-Type header. len() is the size of the body in bytes and raises
+    TypeError if the size of a file isn't known, in which case the body is
+    sent chunked.
+    """
+
+    def __init__(self, fields, boundary=None, chunk_size=256):
+        if boundary is None:
+            import uos
+            import ubinascii
+            boundary = ubinascii.hexlify(uos.urandom(12)).decode()
+        self.boundary = boundary
+        self.content_type = "multipart/form-data; boundary=" + boundary
+        self._fields = fields
+        self._chunk_size = chunk_size
+
+    def _parts(self, field):
+        """Returns the head and data of a field."""
+        name, value = field
+        head = '--%s\r\nContent-Disposition: form-data; name="%s"' % (
+            self.boundary, name)
+        if type(value) is tuple:
+            head += '; filename="%s"' % value[0]
+            if len(value) > 2:
+                head += "\r\nContent-Type: " + value[2]
+            value = value[1]
+        return head + "\r\n\r\n", value
+
+    def __len__(self):
+        from . import _body_size
+        size = len(self.boundary) + 6
+        for field in self._fields:
+            head, value = self._parts(field)
+            if hasattr(value, "readinto"):
+                n = _body_size(value)
+                if n is None:
+                    raise TypeError("Size of %s not known" % field[0])
+            else:
+                n = len(value.encode() if type(value) is str else value)
+            size += len(head.encode()) + n + 2
+        return size
+
+    def __iter__(self):
+        """Yields the body in parts. Parts of files are memoryviews of a
+        buffer that's reused for the next part."""
+        buf = None
+        for field in self._fields:
+            head, value = self._parts(field)
+            yield head
+            if hasattr(value, "readinto"):
+                if buf is None:
+                    buf = bytearray(self._chunk_size)
+                    mv = memoryview(buf)
+                while True:
+                    n = value.readinto(buf)
+                    if not n:
+                        break
+                    yield mv[:n]
+            else:
+                yield value
+            yield b"\r\n"
+        yield "--%s--\r\n" % self.boundary
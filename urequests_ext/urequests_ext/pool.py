@@ -0,0 +1,64 @@
+import utime
+
+
+class ConnectionPool:
+    """Pool of open sockets for HTTP/1.1 keep-alive requests.
+
+    Sockets are kept per (proto, host, port). At most max_per_host idle
+    sockets are kept for each host and max_size in total, the longest idle
+    are closed first. Sockets idle for longer than max_idle_ms are closed.
+
+    If a response is closed before its whole body was read, up to max_drain
+    bytes (-1 for no limit) of the rest are read so the socket can be
+    reused, otherwise the socket is closed. This lets r.close() return the
+    socket of a response with a small body that wasn't read.
+    """
+
+    def __init__(self, max_size=4, max_per_host=2, max_idle_ms=30000,
+                 max_drain=1024):
+        self.max_size = max_size
+        self.max_per_host = max_per_host
+        self.max_idle_ms = max_idle_ms
+        self.max_drain = max_drain
+        # List of idle [key, socket, ticks_ms when released], oldest first
+        self._idle = []
+
+    def __len__(self):
+        return len(self._idle)
+
+    def get(self, key):
+        """Returns an idle socket connected to key or None."""
+        self.evict()
+        for i in range(len(self._idle) - 1, -1, -1):
+            if self._idle[i][0] == key:
+                return self._idle.pop(i)[1]
+        return None
+
+    def put(self, key, s):
+        """Returns a socket to the pool after a complete response was read
+        from it."""
+        self.evict()
+        num_host = 0
+        for conn in self._idle:
+            if conn[0] == key:
+                num_host += 1
+        if num_host >= self.max_per_host:
+            for i in range(len(self._idle)):
+                if self._idle[i][0] == key:
+                    self._idle.pop(i)[1].close()
+                    break
+        elif len(self._idle) >= self.max_size:
+            self._idle.pop(0)[1].close()
+        self._idle.append([key, s, utime.ticks_ms()])
+
+    def evict(self):
+        """Closes sockets that have been idle for longer than max_idle_ms."""
+        now = utime.ticks_ms()
+        while self._idle and \
+                utime.ticks_diff(now, self._idle[0][2]) >= self.max_idle_ms:
+            self._idle.pop(0)[1].close()
+
+    def close(self):
+        """Closes all idle sockets."""
+        while self._idle:
+            self._idle.pop()[1].close()
@@ -1,67 +1,205 @@
 
 
+class Headers:
+    """Response headers kept as the raw header block in one buffer with the
+    offsets of each header's name and value.
+
+    Names are matched case-insensitively in the buffer, only the values that
+    are looked up are copied out (as bytes). Pass names as bytes to avoid
+    allocating for the lookup.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        # Start of the name, end of the name, start and end of the value of
+        # each header
+        self._index = []
+
+    def add(self, line):
+        """Adds a raw header line, e.g. b"Content-Length: 12\\r\\n"."""
+        start = len(self._buf)
+        colon = line.find(b":")
+        if colon < 0:
+            return
+        self._buf.extend(line)
+        buf = self._buf
+        value = start + colon + 1
+        end = len(buf)
+        while value < end and buf[value] in b" \t":
+            value += 1
+        while end > value and buf[end - 1] in b" \t\r\n":
+            end -= 1
+        self._index.extend((start, start + colon, value, end))
+
+    def _find(self, name, i=0):
+        """Returns the index of the next header called name from i, or -1."""
+        if type(name) is str:
+            name = name.encode()
+        buf = self._buf
+        index = self._index
+        n = len(name)
+        for i in range(i, len(index), 4):
+            start = index[i]
+            if index[i + 1] - start != n:
+                continue
+            for j in range(n):
+                # Header names are ASCII, | 0x20 lowercases letters and
+                # leaves the other allowed characters unchanged
+                if buf[start + j] | 0x20 != name[j] | 0x20:
+                    break
+            else:
+                return i
+        return -1
+
+    def _value(self, i):
+        return bytes(self._buf[self._index[i + 2]:self._index[i + 3]])
+
+    def get(self, name, default=None):
+        i = self._find(name)
+        if i < 0:
+            return default
+        return self._value(i)
+
+    def get_all(self, name):
+        """Returns a list of the values of all headers called name."""
+        values = []
+        i = self._find(name)
+        while i >= 0:
+            values.append(self._value(i))
+            i = self._find(name, i + 4)
+        return values
+
+    def __getitem__(self, name):
+        i = self._find(name)
+        if i < 0:
+            raise KeyError(name)
+        return self._value(i)
+
+    def __contains__(self, name):
+        return self._find(name) >= 0
+
+    def __len__(self):
+        return len(self._index) // 4
+
+    def __iter__(self):
+        """Yields each header name in lowercase."""
+        index = self._index
+        for i in range(0, len(index), 4):
+            yield bytes(self._buf[index[i]:index[i + 1]]).lower()
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        """Returns a list of (lowercase name, value) for each header."""
+        index = self._index
+        return [(bytes(self._buf[index[i]:index[i + 1]]).lower(),
+                 self._value(i)) for i in range(0, len(index), 4)]
+
+
 class Response:
+    # True if the server answered 304 Not Modified and the body is read
+    # from a ResponseCache
+    from_cache = False
+    # RequestStats of the request, if it was instrumented
+    stats = None
 
-    def __init__(self, f):
+    def __init__(self, f, headers=None):
         self.raw = f
         self.encoding = "utf-8"
         self._cached = None
+        self.headers = headers if headers is not None else Headers()
+
+    def _close_raw(self):
+        self.raw.close()
+        self.raw = None
+        if self.stats is not None:
+            self.stats.finish()
 
     def close(self):
         if self.raw:
-            self.raw.close()
-            self.raw = None
+            self._close_raw()
         self._cached = None
 
     @property
     def content(self):
         if self._cached is None:
             self._cached = self.raw.read()
-            self.raw.close()
-            self.raw = None
+            self._close_raw()
         return self._cached
 
     @property
     def text(self):
         return str(self.content, self.encoding)
 
-    def json(self):
+    def readinto(self, buf, n=-1):
+        """Reads the next part of the body into buf, at most n bytes if n is
+        given. Returns the number of bytes read, 0 at the end of the body."""
+        if self.raw is None:
+            return 0
+        if n < 0:
+            n = len(buf)
+        return self.raw.readinto(buf, n)
+
+    def iter_content(self, chunk_size=256, buf=None):
+        """Yields the body in parts of up to chunk_size bytes. The parts are
+        memoryviews of buf, which is reused for every part, so copy a part if
+        it's needed after reading the next one. If buf is not given a
+        chunk_size bytearray is allocated. The response is closed at the end
+        of the body."""
+        if buf is None:
+            buf = bytearray(chunk_size)
+        elif chunk_size > len(buf):
+            chunk_size = len(buf)
+        mv = memoryview(buf)
+        while True:
+            n = self.readinto(buf, chunk_size)
+            if not n:
+                break
+            yield mv[:n]
+        self.close()
+
+    def iter_lines(self):
+        """Yields each line of the body without the line ending. The response
+        is closed at the end of the body."""
+        while self.raw is not None:
+            l = self.raw.readline()
+            if not l:
+                break
+            if l.endswith(b"\n"):
+                l = l[:-2] if l.endswith(b"\r\n") else l[:-1]
+            yield l
+        self.close()
+
+    def save_to(self, path, chunk_size=256, buf=None):
+        """Writes the body to a file at path without reading all of it into
+        memory. Returns the number of bytes written."""
+        size = 0
+        with open(path, "wb") as f:
+            for part in self.iter_content(chunk_size, buf):
+                f.write(part)
+                size += len(part)
+        return size
+
+    def json(self, stream=False):
+        """Decodes the body as JSON. If stream is True the JSON is decoded as
+        it's read from the socket instead of reading the whole body first,
+        which halves the peak memory use. For picking values out of large
+        documents use jsonstream.select(r.raw, paths)."""
         import ujson
-        return ujson.loads(self.content)
+        if not stream or self._cached is not None:
+            return ujson.loads(self.content)
+        try:
+            return ujson.load(self.raw)
+        finally:
+            self.close()
 
 
 class RedirectResponse(Response):
-    def __init__(self, f, raw_location_header):
-        super().__init__(f)
-        self.raw_location_header = raw_location_header
-        self._cached_location = None
-
     @property
     def location(self):
-        if not self._cached_location:
-            _, location = self.raw_location_header.split(b':', 1)
-            self._cached_location = location.strip()
-            self.raw_location_header = None
-        return self._cached_location
-
+        return self.headers.get(b"location")
 
-class ResponseWithHeaders(Response):
-    def __init__(self, f, raw_header_list):
-        super().__init__(f)
-        self.raw_header_list = raw_header_list
-        self._cached_headers = None
 
-    def close(self):
-        super().close()
-        self.raw_header_list = None
-        self._cached_headers = None
-
-    @property
-    def headers(self):
-        if self._cached_headers is None:
-            self._cached_headers = {}
-            for l in self.raw_header_list:
-                k, v = l.split(b':', 1)
-                self._cached_headers[k.strip().lower()] = v.strip()
-            self.raw_header_list = None
-        return self._cached_headers
+# All responses have headers, kept for compatibility
+ResponseWithHeaders = Response
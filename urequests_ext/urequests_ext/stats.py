@@ -0,0 +1,183 @@
+"""Request timings and byte counts.
+
+    collector = stats.StatsCollector()
+    urequests_ext.stats_collector = collector
+    ...
+    collector.dump()
+
+or for one request:
+
+    r = urequests_ext.get(url, stats=True)
+    r.close()
+    print(r.stats.durations())
+"""
+
+import utime
+
+# Phases of a request, each ending at the RequestStats attribute of the
+# same index in _MARKS
+PHASES = ("dns", "connect", "tls", "send", "wait", "headers", "body")
+_MARKS = ("dns", "connect", "tls", "sent", "first_byte", "headers", "end")
+
+
+class RequestStats:
+    """Timings of one request. start and the attributes in _MARKS are
+    utime.ticks_us() at the end of each phase, None if the phase didn't
+    happen, e.g. dns, connect and tls for a reused connection. end is set
+    when the response is closed."""
+
+    def __init__(self, method, host, collector=None):
+        self.method = method
+        self.host = host
+        self.start = utime.ticks_us()
+        self.dns = None
+        self.connect = None
+        self.tls = None
+        self.sent = None
+        self.first_byte = None
+        self.headers = None
+        self.end = None
+        self.status_code = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.reused = False
+        self.error = False
+        self._collector = collector
+
+    def durations(self):
+        """Returns a dict of the time in microseconds of each phase that
+        happened."""
+        d = {}
+        prev = self.start
+        for i in range(len(PHASES)):
+            t = getattr(self, _MARKS[i])
+            if t is not None:
+                d[PHASES[i]] = utime.ticks_diff(t, prev)
+                prev = t
+        return d
+
+    @property
+    def total_us(self):
+        if self.end is None:
+            return None
+        return utime.ticks_diff(self.end, self.start)
+
+    def finish(self, error=False):
+        """Ends the request and adds it to the collector."""
+        if self.end is not None:
+            return
+        self.end = utime.ticks_us()
+        self.error = error
+        if self._collector is not None:
+            self._collector.add(self)
+
+
+class CountingSocket:
+    """Counts the bytes written to and read from a socket into a
+    RequestStats."""
+
+    def __init__(self, s, stats):
+        self.sock = s
+        self.stats = stats
+
+    def settimeout(self, timeout):
+        if hasattr(self.sock, "settimeout"):
+            self.sock.settimeout(timeout)
+
+    def write(self, buf):
+        n = self.sock.write(buf)
+        self.stats.bytes_sent += len(buf) if n is None else n
+        return n
+
+    def read(self, n=-1):
+        data = self.sock.read(n) if n >= 0 else self.sock.read()
+        self.stats.bytes_received += len(data)
+        return data
+
+    def readinto(self, buf, n=-1):
+        if n < 0:
+            n = self.sock.readinto(buf)
+        else:
+            n = self.sock.readinto(buf, n)
+        self.stats.bytes_received += n or 0
+        return n
+
+    def readline(self, limit=-1):
+        l = self.sock.readline() if limit < 0 else self.sock.readline(limit)
+        self.stats.bytes_received += len(l)
+        return l
+
+    def close(self):
+        self.sock.close()
+
+
+class HostStats:
+    """Totals of the requests to one host. phase_us is the total time of
+    each phase in PHASES and phase_count the number of requests it happened
+    in, e.g. dns, connect and tls only for new connections. histogram is the
+    number of requests with a total time of up to each of the collector's
+    buckets_ms, the last for longer ones."""
+
+    def __init__(self, num_buckets):
+        self.count = 0
+        self.errors = 0
+        self.reused = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.phase_us = [0] * len(PHASES)
+        self.phase_count = [0] * len(PHASES)
+        self.histogram = [0] * (num_buckets + 1)
+
+
+class StatsCollector:
+    """Aggregates RequestStats per host. Set urequests_ext.stats_collector
+    to collect all requests."""
+
+    def __init__(self, buckets_ms=(50, 100, 200, 500, 1000, 2000, 5000)):
+        self.buckets_ms = buckets_ms
+        self.hosts = {}
+
+    def add(self, stats):
+        host = self.hosts.get(stats.host)
+        if host is None:
+            host = self.hosts[stats.host] = HostStats(len(self.buckets_ms))
+        host.count += 1
+        if stats.error:
+            host.errors += 1
+        if stats.reused:
+            host.reused += 1
+        host.bytes_sent += stats.bytes_sent
+        host.bytes_received += stats.bytes_received
+        prev = stats.start
+        for i in range(len(PHASES)):
+            t = getattr(stats, _MARKS[i])
+            if t is not None:
+                host.phase_us[i] += utime.ticks_diff(t, prev)
+                host.phase_count[i] += 1
+                prev = t
+        total_ms = stats.total_us // 1000
+        i = 0
+        while i < len(self.buckets_ms) and total_ms > self.buckets_ms[i]:
+            i += 1
+        host.histogram[i] += 1
+
+    def dump(self):
+        """Prints the totals of each host, with the mean time of each phase
+        in milliseconds over the requests it happened in."""
+        for name in self.hosts:
+            host = self.hosts[name]
+            print("%s: %d requests, %d errors, %d reused, %d bytes sent, "
+                  "%d bytes received" % (name, host.count, host.errors,
+                                         host.reused, host.bytes_sent,
+                                         host.bytes_received))
+            print("  mean ms: " + " ".join(
+                ["%s=%d" % (PHASES[i], host.phase_us[i] //
+                            host.phase_count[i] // 1000)
+                 for i in range(len(PHASES)) if host.phase_count[i]]))
+            print("  histogram ms: " + " ".join(
+                ["<=%d:%d" % (self.buckets_ms[i], host.histogram[i])
+                 for i in range(len(self.buckets_ms))]) +
+                " >%d:%d" % (self.buckets_ms[-1], host.histogram[-1]))
+
+    def reset(self):
+        self.hosts = {}
@@ -0,0 +1,271 @@
+import uerrno
+import uio
+import utime
+
+
+def check_deadline(deadline):
+    """Raises OSError(ETIMEDOUT) if the ticks_ms deadline has passed."""
+    if deadline is not None and \
+            utime.ticks_diff(deadline, utime.ticks_ms()) <= 0:
+        raise OSError(uerrno.ETIMEDOUT)
+
+
+def _pool_put(pool, key, s):
+    # Pool the socket of a stats.CountingSocket rather than the wrapper, so
+    # later requests don't count into finished stats
+    pool.put(key, getattr(s, "sock", s))
+
+
+def _skip(reader, max_drain):
+    """Reads the rest of a body, at most max_drain bytes unless it's -1."""
+    buf = bytearray(128)
+    n = 0
+    try:
+        while max_drain < 0 or n < max_drain:
+            m = reader.readinto(buf)
+            if not m:
+                return
+            n += m
+    except (OSError, ValueError):
+        pass
+
+
+class LengthReader(uio.IOBase):
+    """Reads a response body of a known length from a socket. If length is
+    None the body is read until the socket is closed.
+
+    If a pool is given, closing the reader after the whole body was read
+    returns the socket to the pool, otherwise the socket is closed. The rest
+    of the body is read first if it's at most pool.max_drain bytes. If a
+    ticks_ms deadline is given, reads after it raise OSError(ETIMEDOUT).
+    """
+
+    def __init__(self, s, length, pool=None, pool_key=None, deadline=None):
+        self._s = s
+        # Bytes left to read, -1 if the length is not known
+        self.remaining = -1 if length is None else length
+        # The socket can only be reused if the end of the body is known
+        self._pool = None if length is None else pool
+        self._pool_key = pool_key
+        self._deadline = deadline
+
+    def read(self, n=-1):
+        if self.remaining >= 0 and (n < 0 or n > self.remaining):
+            n = self.remaining
+        if not n:
+            return b""
+        check_deadline(self._deadline)
+        data = self._s.read(n)
+        if self.remaining > 0:
+            self.remaining -= len(data)
+        elif not data:
+            self.remaining = 0
+        return data
+
+    def readinto(self, buf, n=-1):
+        if n < 0 or n > len(buf):
+            n = len(buf)
+        if 0 <= self.remaining < n:
+            n = self.remaining
+        if not n:
+            return 0
+        check_deadline(self._deadline)
+        n = self._s.readinto(buf, n)
+        if self.remaining > 0:
+            self.remaining -= n
+        elif not n:
+            self.remaining = 0
+        return n
+
+    def readline(self):
+        if not self.remaining:
+            return b""
+        check_deadline(self._deadline)
+        l = self._s.readline(self.remaining)
+        if self.remaining > 0:
+            self.remaining -= len(l)
+        elif not l:
+            self.remaining = 0
+        return l
+
+    def close(self):
+        if self._s is None:
+            return
+        pool = self._pool
+        if pool is not None and self.remaining and (
+                pool.max_drain < 0 or self.remaining <= pool.max_drain):
+            _skip(self, -1)
+        if pool is not None and not self.remaining:
+            _pool_put(pool, self._pool_key, self._s)
+        else:
+            self._s.close()
+        self._s = None
+
+
+class ChunkedReader(uio.IOBase):
+    """Decodes a response body sent with Transfer-Encoding: chunked as it's
+    read from a socket.
+
+    Data is read straight from the socket into the caller's buffer, only the
+    size of the current chunk is kept, so memory use doesn't depend on the
+    size of the body or its chunks.
+
+    If a pool is given, closing the reader after the whole body was read
+    returns the socket to the pool, otherwise the socket is closed. Up to
+    pool.max_drain bytes of the rest of the body are read first. If a
+    ticks_ms deadline is given, reads after it raise OSError(ETIMEDOUT).
+    """
+
+    def __init__(self, s, pool=None, pool_key=None, deadline=None):
+        self._s = s
+        self._pool = pool
+        self._pool_key = pool_key
+        self._deadline = deadline
+        # Bytes left in the current chunk, None before the first chunk
+        self._chunk_remaining = None
+        self.done = False
+
+    def _chunk(self):
+        """Returns the number of bytes left in the current chunk, starting
+        the next chunk if needed. Returns 0 at the end of the body."""
+        if self._chunk_remaining or self.done:
+            return self._chunk_remaining
+        check_deadline(self._deadline)
+        s = self._s
+        if self._chunk_remaining is not None:
+            # CRLF after the chunk data
+            s.readline()
+        l = s.readline()
+        if not l:
+            raise ValueError("Truncated chunked body")
+        size = int(l.split(b";", 1)[0], 16)
+        if not size:
+            # Skip trailers
+            while True:
+                l = s.readline()
+                if not l or l == b"\r\n":
+                    break
+            self.done = True
+        self._chunk_remaining = size
+        return size
+
+    def read(self, n=-1):
+        if n < 0:
+            data = b""
+            while self._chunk():
+                chunk = self.read(self._chunk_remaining)
+                if not chunk:
+                    raise ValueError("Truncated chunked body")
+                data += chunk
+            return data
+        n = min(n, self._chunk())
+        if not n:
+            return b""
+        check_deadline(self._deadline)
+        data = self._s.read(n)
+        self._chunk_remaining -= len(data)
+        return data
+
+    def readinto(self, buf, n=-1):
+        if n < 0 or n > len(buf):
+            n = len(buf)
+        n = min(n, self._chunk())
+        if not n:
+            return 0
+        check_deadline(self._deadline)
+        n = self._s.readinto(buf, n)
+        self._chunk_remaining -= n
+        return n
+
+    def readline(self):
+        l = b""
+        while self._chunk():
+            check_deadline(self._deadline)
+            part = self._s.readline(self._chunk_remaining)
+            self._chunk_remaining -= len(part)
+            l += part
+            if not part or part.endswith(b"\n"):
+                break
+        return l
+
+    def close(self):
+        if self._s is None:
+            return
+        pool = self._pool
+        if pool is not None and not self.done and pool.max_drain:
+            _skip(self, pool.max_drain)
+        if pool is not None and self.done:
+            _pool_put(pool, self._pool_key, self._s)
+        else:
+            self._s.close()
+        self._s = None
+
+
+class DecompressReader(uio.IOBase):
+    """Decompresses a gzip or deflate (zlib) response body as it's read
+    from raw, which is closed with the reader. Decompression uses a window
+    of 2**wbits bytes, which must be at least the window the body was
+    compressed with. DecompIO would take the window of a deflate body from
+    its zlib header, so the header is checked here and ValueError raised if
+    its window is larger.
+
+    Uses uzlib.DecompIO, or deflate.DeflateIO on MicroPython 1.21+ which
+    doesn't have uzlib."""
+
+    def __init__(self, raw, gzip=False, wbits=15):
+        try:
+            import uzlib
+        except ImportError:
+            uzlib = None
+        self._raw = raw
+        if not gzip:
+            header = b""
+            while len(header) < 2:
+                data = raw.read(2 - len(header))
+                if not data:
+                    raise ValueError("Truncated deflate body")
+                header += data
+            cmf = header[0]
+            if cmf & 0x0f != 8 or ((cmf << 8) | header[1]) % 31 or \
+                    header[1] & 0x20:
+                raise ValueError("Unsupported deflate header")
+            if (cmf >> 4) + 8 > wbits:
+                raise ValueError("Deflate window larger than 2**wbits")
+        # The rest of a deflate body is raw deflate data
+        if uzlib is not None:
+            self._d = uzlib.DecompIO(raw, wbits + 16 if gzip else -wbits)
+        else:
+            import deflate
+            self._d = deflate.DeflateIO(
+                raw, deflate.GZIP if gzip else deflate.RAW, wbits)
+        self._eof = False
+
+    def read(self, n=-1):
+        data = self._d.read() if n < 0 else self._d.read(n)
+        if not data:
+            self._eof = True
+        return data
+
+    def readinto(self, buf, n=-1):
+        if 0 <= n < len(buf):
+            buf = memoryview(buf)[:n]
+        n = self._d.readinto(buf)
+        if not n:
+            self._eof = True
+        return n
+
+    def readline(self):
+        return self._d.readline()
+
+    def close(self):
+        raw = self._raw
+        if raw is None:
+            return
+        if self._eof:
+            # Read the rest of the stream, e.g. the gzip trailer, so the
+            # connection can be reused
+            for _ in range(4):
+                if not raw.read(16):
+                    break
+        raw.close()
+        self._raw = None